@@ -0,0 +1,200 @@
+# Thor-Grid Generator Benchmarks
+# Runs the dungeon generators headless with fixed seeds over a matrix of grid sizes, room counts and
+# encounter counts. Reports wall time, peak memory (overall and per phase) and output size, and saves the results as JSON
+# so two runs (e.g. before and after a change) can be compared.
+#
+# Usage:
+#   python benchgen.py --output before.json
+#   python benchgen.py --output after.json --compare before.json
+#   python benchgen.py --generators floortowall --sizes 500,1000 --rooms 200 --encounters 20 --seeds 1-3
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+GENERATORS = {
+    'floortowall': 'floortowall.py',
+    'initgenerator': 'thor-grid_initgenerator.py',
+    'minmaxgenerator': 'thor-grid_minmaxgenerator.py',
+}
+
+def load_generator(name):
+    """Imports a generator script by file path (the script names aren't valid module names)."""
+    spec = importlib.util.spec_from_file_location(f"bench_{name}", os.path.join(HERE, GENERATORS[name]))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def case_settings(name, module, size, rooms, encounters):
+    """Settings for one benchmark case, starting from each generator's own defaults."""
+    settings = {
+        'width': size, 'height': size, 'max_rooms': rooms, 'min_size': 6, 'max_size': 12,
+        'num_encounters': encounters, 'min_monsters': 1, 'max_monsters': 4, 'num_treasures': 2,
+        'filename': 'bench.json',
+    }
+    if name == 'floortowall':
+        return dict(module.DEFAULT_SETTINGS, **settings)
+    # The other generators place between min_rooms and max_rooms; pin both to the case's count
+    return dict(settings, min_rooms=rooms)
+
+@contextlib.contextmanager
+def headless(home):
+    """Silences progress prints and points the Desktop output folder at a scratch directory."""
+    saved = {key: os.environ.get(key) for key in ('HOME', 'USERPROFILE')}
+    os.environ['HOME'] = os.environ['USERPROFILE'] = home
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        for key, value in saved.items():
+            if value is None: os.environ.pop(key, None)
+            else: os.environ[key] = value
+
+def run_phases(name, module, settings, seed, scratch, track_memory=False):
+    """Runs one generation. Returns ({phase: seconds}, {counter: n}, output_bytes, {phase: peak bytes}),
+    with output_bytes None on failure. Phase peaks are only recorded with track_memory under tracemalloc."""
+    phases, counters, peaks = {}, {}, {}
+    if name == 'floortowall':
+        # floortowall reports its own phases (place_rooms, carve_corridors, monsters, ...) and counters
+        stats = module.PhaseStats(track_memory)
+        output_data = module.generate(settings, seed, stats)
+        if output_data is not None:
+            stats.phase('save')
+            path = os.path.join(scratch, 'bench.json')
+            module.save_dungeon(output_data, path, settings.get('wall_format', 'grid'))
+            stats.stop()
+        phases, counters, peaks = stats.phases, stats.counters, stats.peaks or {}
+        if output_data is None:
+            return phases, counters, None, peaks
+    else:
+        # Monolithic scripts: generation and saving happen in one call
+        path = os.path.join(scratch, 'Desktop', 'VTT_Dungeons', settings['filename'])
+        if os.path.exists(path): os.remove(path)
+        random.seed(seed)
+        start = time.perf_counter()
+        module.generate_and_save_dungeon(dict(settings))
+        phases['generate_and_save'] = time.perf_counter() - start
+        if track_memory and tracemalloc.is_tracing(): # One phase, so its peak is the whole run's
+            peaks['generate_and_save'] = tracemalloc.get_traced_memory()[1]
+        if not os.path.exists(path):
+            return phases, counters, None, peaks
+    return phases, counters, os.path.getsize(path), peaks
+
+def run_case(name, module, settings, seed, scratch, measure_memory):
+    """Times one case, then (optionally) repeats it under tracemalloc for peak memory, overall and per phase."""
+    with headless(scratch):
+        phases, counters, output_bytes, _ = run_phases(name, module, settings, seed, scratch)
+        peak_bytes, phase_peaks = None, {}
+        if measure_memory and output_bytes is not None:
+            tracemalloc.start()
+            try:
+                phase_peaks = run_phases(name, module, settings, seed, scratch, track_memory=True)[3]
+                peak_bytes = max([tracemalloc.get_traced_memory()[1], *phase_peaks.values()])
+            finally:
+                tracemalloc.stop()
+    return {
+        'ok': output_bytes is not None,
+        'seconds': sum(phases.values()),
+        'phases': {phase: {'seconds': seconds, 'peak_bytes': phase_peaks.get(phase)} for phase, seconds in phases.items()},
+        'counters': counters,
+        'peak_bytes': peak_bytes,
+        'output_bytes': output_bytes,
+    }
+
+def parse_list(text):
+    return [int(part) for part in text.split(',') if part]
+
+def parse_seeds(text):
+    if '-' in text:
+        start, end = text.split('-', 1)
+        return list(range(int(start), int(end) + 1))
+    return parse_list(text)
+
+def case_key(case):
+    return (case['generator'], case['width'], case['height'], case['rooms'], case['encounters'])
+
+def median_seconds(cases):
+    """Median wall time per case key, over the seeds that succeeded."""
+    grouped = {}
+    for case in cases:
+        if case['ok']:
+            grouped.setdefault(case_key(case), []).append(case['seconds'])
+    return {key: statistics.median(values) for key, values in grouped.items()}
+
+def compare(results, baseline):
+    """Prints the change in median wall time against a previous results file."""
+    now, before = median_seconds(results['cases']), median_seconds(baseline['cases'])
+    print("\n--- Comparison (median wall time) ---")
+    for key in sorted(now):
+        if key in before and before[key] > 0:
+            ratio = now[key] / before[key]
+            print(f"  {key[0]:<16} {key[1]}x{key[2]:<6} rooms={key[3]:<5} enc={key[4]:<4} "
+                  f"{before[key]:8.3f}s -> {now[key]:8.3f}s  ({ratio:5.2f}x)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Thor-Grid dungeon generators.")
+    parser.add_argument('--generators', default=','.join(GENERATORS), help="Comma-separated generator names.")
+    parser.add_argument('--sizes', default='80,250,500', help="Square grid sizes (default: 80,250,500).")
+    parser.add_argument('--rooms', default='10,60,200', help="Room counts (default: 10,60,200).")
+    parser.add_argument('--encounters', default='4,20', help="Encounter room counts (default: 4,20).")
+    parser.add_argument('--seeds', default='1-3', help="Seeds, e.g. '1-3' or '7,11' (default: 1-3).")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the tracemalloc pass (halves the run time).")
+    parser.add_argument('--output', default='bench_results.json', help="Where to save the results JSON.")
+    parser.add_argument('--compare', metavar='BASELINE_JSON', help="Previous results file to compare against.")
+    args = parser.parse_args()
+
+    names = [name for name in args.generators.split(',') if name]
+    for name in names:
+        if name not in GENERATORS:
+            parser.error(f"Unknown generator '{name}'. Choose from: {', '.join(GENERATORS)}")
+    modules = {name: load_generator(name) for name in names}
+
+    cases = []
+    with tempfile.TemporaryDirectory() as scratch:
+        for name in names:
+            for size in parse_list(args.sizes):
+                for rooms in parse_list(args.rooms):
+                    for encounters in parse_list(args.encounters):
+                        settings = case_settings(name, modules[name], size, rooms, encounters)
+                        for seed in parse_seeds(args.seeds):
+                            result = run_case(name, modules[name], settings, seed, scratch, not args.no_memory)
+                            case = dict(generator=name, width=size, height=size, rooms=rooms,
+                                        encounters=encounters, seed=seed, **result)
+                            cases.append(case)
+                            peak = f"{case['peak_bytes'] / 2**20:7.1f} MB" if case['peak_bytes'] else "      -   "
+                            size_text = f"{case['output_bytes'] / 2**10:9.1f} KB" if case['ok'] else "   (failed)"
+                            print(f"{name:<16} {size}x{size:<6} rooms={rooms:<5} enc={encounters:<4} seed={seed:<4} "
+                                  f"{case['seconds']:8.3f}s {peak} {size_text}")
+
+    results = {
+        'meta': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'argv': sys.argv[1:],
+        },
+        'cases': cases,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nSaved {len(cases)} results to '{args.output}'.")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+if __name__ == "__main__":
+    main()
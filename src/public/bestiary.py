@@ -0,0 +1,93 @@
+# Thor-Grid Bestiary
+# Loads monster lists (a generator's built-in MONSTER_MANUAL or an external JSON file with thousands
+# of entries) into an index, so "which monsters fit this room" is a bucket lookup and encounters can
+# be filled to an XP budget with binary searches instead of scanning the whole list.
+#
+# Bestiary JSON: a list of monsters, or {"monsters": [...]}. Each monster looks like a MONSTER_MANUAL
+# entry: "name" and "hit_dice" are required; "size" (tiles, default 1), "ac", "initiative_bonus",
+# "sightRadius" and "imageUrl" are optional. "xp" or "cr" (e.g. 2 or "1/4") enables XP budgets.
+
+import json
+from bisect import bisect_right
+from fractions import Fraction
+
+import dice
+
+# Experience points by challenge rating (5e)
+CR_XP = {
+    Fraction(0): 10, Fraction(1, 8): 25, Fraction(1, 4): 50, Fraction(1, 2): 100,
+    1: 200, 2: 450, 3: 700, 4: 1100, 5: 1800, 6: 2300, 7: 2900, 8: 3900, 9: 5000, 10: 5900,
+    11: 7200, 12: 8400, 13: 10000, 14: 11500, 15: 13000, 16: 15000, 17: 18000, 18: 20000,
+    19: 22000, 20: 25000, 21: 33000, 22: 41000, 23: 50000, 24: 62000, 25: 75000, 26: 90000,
+    27: 105000, 28: 120000, 29: 135000, 30: 155000,
+}
+
+MONSTER_DEFAULTS = {"size": 1, "ac": 10, "initiative_bonus": 0, "sightRadius": 60, "imageUrl": ""}
+
+def monster_xp(monster):
+    """XP for a monster from its 'xp' or 'cr' field, or None if it has neither."""
+    if monster.get('xp') is not None:
+        return int(monster['xp'])
+    if monster.get('cr') is not None:
+        cr = Fraction(str(monster['cr']))
+        if cr not in CR_XP:
+            raise ValueError(f"Monster '{monster['name']}' has an unknown challenge rating: {monster['cr']}")
+        return CR_XP[cr]
+    return None
+
+class Bestiary:
+    """Monster templates indexed by size (and by XP when the entries have it)."""
+    def __init__(self, monsters):
+        self.monsters = list(monsters)
+        self.sizes = sorted({m['size'] for m in self.monsters})
+        # For each distinct size s: every monster no bigger than s, in the original list order
+        self._fitting = [[m for m in self.monsters if m['size'] <= size] for size in self.sizes]
+        # The same buckets as (sorted xp list, monsters in that order) for budget searches
+        xp = {id(m): monster_xp(m) or 0 for m in self.monsters}
+        self._by_xp = []
+        for bucket in self._fitting:
+            rated = sorted((xp[id(m)], i) for i, m in enumerate(bucket) if xp[id(m)] > 0)
+            self._by_xp.append(([value for value, _ in rated], [bucket[i] for _, i in rated]))
+
+    def __len__(self):
+        return len(self.monsters)
+
+    def _bucket(self, max_size):
+        return bisect_right(self.sizes, max_size) - 1
+
+    def fitting(self, room_w, room_h):
+        """Monsters whose footprint fits a room_w x room_h room, in list order (a shared list; don't modify it)."""
+        index = self._bucket(min(room_w, room_h))
+        return self._fitting[index] if index >= 0 else []
+
+    def build_encounter(self, xp_budget, room_w, room_h, rng, max_monsters=None):
+        """Picks monsters that fit the room until the XP budget is spent (or max_monsters is reached).
+        Each pick is uniform among the fitting monsters worth no more than the XP left. Returns the templates."""
+        index = self._bucket(min(room_w, room_h))
+        if index < 0:
+            return []
+        xps, monsters = self._by_xp[index]
+        picks, remaining = [], xp_budget
+        while max_monsters is None or len(picks) < max_monsters:
+            affordable = bisect_right(xps, remaining)
+            if affordable == 0:
+                break
+            pick = rng.randrange(affordable)
+            picks.append(monsters[pick])
+            remaining -= xps[pick]
+        return picks
+
+def load_bestiary(path):
+    """Reads a bestiary JSON file into a Bestiary. Raises ValueError for malformed entries."""
+    with open(path) as f:
+        data = json.load(f)
+    entries = data.get('monsters', []) if isinstance(data, dict) else data
+    monsters = []
+    for number, entry in enumerate(entries, 1):
+        if not isinstance(entry, dict) or 'name' not in entry or 'hit_dice' not in entry:
+            raise ValueError(f"Bestiary entry {number} needs at least a 'name' and 'hit_dice'")
+        monster = dict(MONSTER_DEFAULTS, **entry)
+        dice.compile_dice(monster['hit_dice']) # Fail on bad dice now rather than mid-generation
+        monster_xp(monster)
+        monsters.append(monster)
+    return Bestiary(monsters)
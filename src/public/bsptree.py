@@ -0,0 +1,60 @@
+# Thor-Grid BSP Layout
+# Binary space partitioning for room layouts. The map is cut into exactly as many leaves as rooms are
+# wanted, each cut placed so both sides can still hold their share of min-size rooms, and one room goes
+# in each leaf. Nothing is ever rejected, so the room count is guaranteed whenever the map has space for
+# it. The splits also give a corridor plan: one link per cut, between the two rooms nearest to it.
+# Works with any room class built as make_room(x, y, w, h) that has x1, y1, x2, y2 (like Rectangle).
+
+def capacity(width, height, min_size, gap=1):
+    """How many min_size rooms (each with gap tiles of wall around it) a width x height area can hold."""
+    leaf = min_size + 2 * gap
+    return (width // leaf) * (height // leaf)
+
+def split_rooms(width, height, count, min_size, max_size, make_room, rng, gap=1):
+    """Places min(count, capacity()) rooms of min_size..max_size tiles per side in a width x height map.
+    Returns (rooms, links): rooms in leaf order and links as (i, j) room index pairs, one per cut, which
+    together form a spanning tree over the rooms."""
+    leaf = min_size + 2 * gap
+    rooms, links = [], []
+
+    def split(x1, y1, x2, y2, count):
+        if count == 1:
+            w = rng.randint(min_size, min(max_size, x2 - x1 - 2 * gap))
+            h = rng.randint(min_size, min(max_size, y2 - y1 - 2 * gap))
+            x = rng.randint(x1 + gap, x2 - gap - w)
+            y = rng.randint(y1 + gap, y2 - gap - h)
+            rooms.append(make_room(x, y, w, h))
+            return
+        cols, rows = (x2 - x1) // leaf, (y2 - y1) // leaf
+        vertical = cols > rows or (cols == rows and rng.random() < 0.5) # Cut across the longer side
+        span, lanes = (cols, rows) if vertical else (rows, cols)
+        if count <= lanes:
+            # Both halves fit in a single strip of leaves
+            left_count, left_cells, right_cells = count // 2, 1, 1
+        else:
+            # Fill whole strips on the left so the right side gets what's left without running short
+            needed = -(-count // lanes)
+            left_cells = needed // 2
+            left_count, right_cells = left_cells * lanes, needed - left_cells
+        low, high = (x1, x2) if vertical else (y1, y2)
+        cut = rng.randint(low + left_cells * leaf, high - right_cells * leaf)
+
+        first = len(rooms)
+        if vertical:
+            split(x1, y1, cut, y2, left_count)
+            middle = len(rooms)
+            split(cut, y1, x2, y2, count - left_count)
+            a = max(range(first, middle), key=lambda i: rooms[i].x2)
+            b = min(range(middle, len(rooms)), key=lambda i: rooms[i].x1)
+        else:
+            split(x1, y1, x2, cut, left_count)
+            middle = len(rooms)
+            split(x1, cut, x2, y2, count - left_count)
+            a = max(range(first, middle), key=lambda i: rooms[i].y2)
+            b = min(range(middle, len(rooms)), key=lambda i: rooms[i].y1)
+        links.append((a, b))
+
+    count = min(count, capacity(width, height, min_size, gap))
+    if count > 0:
+        split(0, 0, width, height, count)
+    return rooms, links
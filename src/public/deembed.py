@@ -0,0 +1,171 @@
+# Thor-Grid State De-embedder
+# Moves base64 images out of a saved VTT state (gameState.json, session_data.json, map files): every
+# "data:image/...;base64,..." string is written once as a file named by a hash of its bytes, and the
+# JSON gets a short URL to that file instead. The same picture used by many tokens is stored once.
+#
+# The JSON is streamed in chunks and never parsed as a whole, and each image is decoded and hashed as it
+# is read, so saves of hundreds of megabytes need only a few megabytes of memory.
+#
+# Usage:
+#   python deembed.py gameState.json [--output light.json] [--images-dir DIR] [--url-prefix images/embedded/]
+
+import argparse
+import base64
+import hashlib
+import os
+import re
+
+from mapformat import IMAGE_EXTENSIONS
+
+CHUNK_SIZE = 1 << 20
+DATA_PREFIXES = ('data:image/', 'data:image\\/') # Some JSON writers escape '/'
+_SPECIAL = re.compile(r'["\\]')             # Ends a run of plain string characters
+_ESCAPES = {'/': '/', '"': '"', '\\': '\\'} # Escapes that can show up inside base64 text
+
+class _Reader:
+    """Buffered text reader that can look a few characters ahead across chunk boundaries."""
+    def __init__(self, f):
+        self.f, self.buf, self.pos, self.eof = f, '', 0, False
+
+    def fill(self, count):
+        """Makes at least count characters available after pos (fewer only at end of file)."""
+        while len(self.buf) - self.pos < count and not self.eof:
+            chunk = self.f.read(CHUNK_SIZE)
+            self.eof = not chunk
+            self.buf = self.buf[self.pos:] + chunk
+            self.pos = 0
+        return len(self.buf) - self.pos >= count
+
+class _ImageSink:
+    """Decodes one base64 payload piece by piece into a temporary file while hashing it."""
+    def __init__(self, images_dir):
+        self.temp_path = os.path.join(images_dir, f".incoming-{os.getpid()}.tmp")
+        self.f = open(self.temp_path, 'wb')
+        self.sha, self.pending, self.size = hashlib.sha256(), '', 0
+
+    def write(self, text):
+        text = self.pending + text
+        whole = len(text) - len(text) % 4 # base64 decodes in groups of 4 characters
+        self.pending = text[whole:]
+        data = base64.b64decode(text[:whole])
+        self.sha.update(data)
+        self.f.write(data)
+        self.size += len(data)
+
+    def finish(self, images_dir, extension):
+        """Closes the file under its content name. Returns (file name, True if it was new)."""
+        if self.pending.rstrip('='):
+            self.write('=' * (-len(self.pending) % 4))
+        self.f.close()
+        name = f"{self.sha.hexdigest()[:16]}.{extension}"
+        path = os.path.join(images_dir, name)
+        if os.path.exists(path):
+            os.remove(self.temp_path)
+            return name, False
+        os.replace(self.temp_path, path)
+        return name, True
+
+def deembed(source, target, images_dir, url_prefix):
+    """Streams source to target with every base64 data: image written to images_dir and replaced by
+    url_prefix + its content name. Returns a dict of counts and sizes."""
+    os.makedirs(images_dir, exist_ok=True)
+    report = {"images": 0, "new_files": 0, "image_bytes": 0}
+    with open(source, encoding='utf-8') as src, open(target, 'w', encoding='utf-8') as out:
+        reader = _Reader(src)
+
+        def copy_string():
+            # Copies the rest of a string (after its opening quote) through its closing quote
+            while reader.fill(1):
+                match = _SPECIAL.search(reader.buf, reader.pos)
+                if match is None:
+                    out.write(reader.buf[reader.pos:])
+                    reader.pos = len(reader.buf)
+                    continue
+                end = match.start()
+                if reader.buf[end] == '"':
+                    out.write(reader.buf[reader.pos:end + 1])
+                    reader.pos = end + 1
+                    return
+                reader.pos = end
+                reader.fill(2)
+                out.write(reader.buf[reader.pos:reader.pos + 2])
+                reader.pos += 2
+
+        def read_image(header):
+            # Streams a base64 payload (after the comma) to a file; returns the new URL
+            sink = _ImageSink(images_dir)
+            while reader.fill(1):
+                match = _SPECIAL.search(reader.buf, reader.pos)
+                end = match.start() if match else len(reader.buf)
+                sink.write(reader.buf[reader.pos:end])
+                reader.pos = end
+                if match is None:
+                    continue
+                if reader.buf[end] == '"':
+                    reader.pos += 1
+                    break
+                reader.fill(6)
+                escaped = reader.buf[reader.pos + 1:reader.pos + 2]
+                if escaped == 'u': # \u002F style
+                    sink.write(chr(int(reader.buf[reader.pos + 2:reader.pos + 6], 16)))
+                    reader.pos += 6
+                    continue
+                sink.write(_ESCAPES.get(escaped, '')) # \n and friends are line breaks in the base64
+                reader.pos += 2
+            mime = header[len('data:'):].split(';', 1)[0]
+            name, new = sink.finish(images_dir, IMAGE_EXTENSIONS.get(mime, 'png'))
+            report["images"] += 1
+            report["new_files"] += new
+            report["image_bytes"] += sink.size if new else 0
+            return url_prefix + name
+
+        while reader.fill(1):
+            quote = reader.buf.find('"', reader.pos)
+            if quote < 0:
+                out.write(reader.buf[reader.pos:])
+                reader.pos = len(reader.buf)
+                continue
+            out.write(reader.buf[reader.pos:quote])
+            reader.pos = quote + 1
+            reader.fill(len(DATA_PREFIXES[1]))
+            if not reader.buf.startswith(DATA_PREFIXES, reader.pos):
+                out.write('"')
+                copy_string()
+                continue
+            # Read the short header up to the comma, e.g. data:image/jpeg;base64,
+            reader.fill(100)
+            comma = reader.buf.find(',', reader.pos, reader.pos + 100)
+            header = reader.buf[reader.pos:comma].replace('\\/', '/') if comma >= 0 else ''
+            if not header.endswith(';base64') or '"' in header or '\\' in header:
+                out.write('"') # Not a base64 image (e.g. an SVG text URL); keep it as it is
+                copy_string()
+                continue
+            reader.pos = comma + 1
+            out.write(f'"{read_image(header)}"')
+    report["source_bytes"] = os.path.getsize(source)
+    report["target_bytes"] = os.path.getsize(target)
+    return report
+
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Move base64 images out of a saved Thor-Grid state into content-named files.")
+    parser.add_argument('source', help="Saved state or map .json.")
+    parser.add_argument('--output', help="Output file (default: overwrite the source).")
+    parser.add_argument('--images-dir', default=os.path.join(here, 'images', 'embedded'),
+                        help="Folder for the image files (default: images/embedded next to this script).")
+    parser.add_argument('--url-prefix', default='images/embedded/',
+                        help="What the rewritten URLs start with (default: images/embedded/, as the VTT serves this folder).")
+    args = parser.parse_args()
+
+    target = args.output or args.source
+    temp_target = f"{target}.{os.getpid()}.tmp" # The source is still being read when target == source
+    report = deembed(args.source, temp_target, args.images_dir, args.url_prefix)
+    os.replace(temp_target, target)
+    saved = report["source_bytes"] - report["target_bytes"]
+    print(f"Moved {report['images']} embedded image(s) into {report['new_files']} new file(s) in '{args.images_dir}' "
+          f"({report['image_bytes'] / 1024:.0f} KB of image data).")
+    print(f"'{target}': {report['source_bytes'] / 1024:.0f} KB -> {report['target_bytes'] / 1024:.0f} KB "
+          f"({saved / 1024:.0f} KB saved).")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# Thor-Grid Dice
+# Dice expressions like '2d6', '10d12+40', '3d8-2' or '1d4+1d6+2' are compiled once into
+# (count, sides, sign) terms plus a flat modifier, cached by expression, so the generators parse each
+# monster's hit dice once instead of once per token. Every roll is deterministic under a seeded RNG.
+
+import random
+import re
+from functools import lru_cache
+
+_TERM = re.compile(r'([+-])?(?:(\d*)d(\d+)|(\d+))')
+
+class Dice:
+    """A compiled dice expression."""
+    def __init__(self, expression, terms, modifier):
+        self.expression = expression
+        self.terms = terms       # ((count, sides, sign), ...)
+        self.modifier = modifier # Flat bonus/penalty
+
+    def __repr__(self):
+        return f"Dice('{self.expression}')"
+
+    def roll(self, rng=random):
+        """Rolls once. Draws one randint(1, sides) per die in order, so seeded results match the old roll_hit_dice()."""
+        total = self.modifier
+        for count, sides, sign in self.terms:
+            total += sign * sum(rng.randint(1, sides) for _ in range(count))
+        return total
+
+@lru_cache(maxsize=None)
+def compile_dice(expression):
+    """Parses an expression like '3d8-2' into a Dice (cached, so each distinct string is parsed once).
+    Raises ValueError for anything that isn't a sum of NdS terms and whole numbers."""
+    text = expression.replace(' ', '').lower()
+    terms, modifier, position = [], 0, 0
+    while position < len(text):
+        match = _TERM.match(text, position)
+        if match is None or (match.group(1) is None and position > 0):
+            raise ValueError(f"Invalid dice expression '{expression}'")
+        sign = -1 if match.group(1) == '-' else 1
+        if match.group(3) is not None:
+            count, sides = int(match.group(2) or 1), int(match.group(3))
+            if sides < 1:
+                raise ValueError(f"Invalid dice expression '{expression}': d{sides}")
+            terms.append((count, sides, sign))
+        else:
+            modifier += sign * int(match.group(4))
+        position = match.end()
+    if not text:
+        raise ValueError("Empty dice expression")
+    return Dice(expression, tuple(terms), modifier)
+
+def roll(expression, rng=random):
+    """Rolls a dice expression once."""
+    return compile_dice(expression).roll(rng)
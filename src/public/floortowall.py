@@ -1,18 +1,78 @@
 # Thor-Grid Dungeon Generator v9 - Advanced Features
 # Adds varied corridors, room features, traps, and secret doors.
+# Requires NumPy (pip install numpy) for the grid engine in gridengine.py.
+#
+# Interactive:  python floortowall.py
+# Batch:        python floortowall.py --batch settings.json --seeds 1-500 [--workers N] [--output-dir DIR] [--stats]
+# Large maps:   python floortowall.py --batch world.json --tile-size 250 --workers 8
+#               (add --check-workers to confirm each seed builds the same map with 1 and 8 workers)
+# Caves:        python floortowall.py --batch settings.json --layout caves
+# Dense maps:   python floortowall.py --batch settings.json --layout bsp [--corridors bsp]
+# Iterating:    python floortowall.py --batch settings.json --seeds 42 --cache-dir .stage_cache
+#               (only the stages after the first changed setting are rebuilt, e.g. new traps keep the layout)
+# Megadungeon:  python floortowall.py --batch settings.json --seeds 42 --levels 10 [--workers N]
+#               (one file per level, built in parallel, linked by stairs at the same spot on adjacent levels)
+# Every map records its seed; the same settings + seed always rebuild the same file.
 
+import argparse
+import contextlib
+import functools
+import hashlib
+import itertools
 import random
 import json
 import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import bsptree
+import dice
+import gridengine
+import mapformat
+import roomgraph
+import thumbnails
+from bestiary import Bestiary, load_bestiary
+from footprint import FootprintIndex
+from occupancy import Occupancy, tile_index
+from phasestats import PhaseStats, write_stats
+from spatialindex import RectIndex
 
 # ==============================================================================
 # --- CONFIGURATION & CONSTANTS ---
 # ==============================================================================
 
-# Define internal tile types for the generator's logic
-VOID = 0
-FLOOR = 1
-WALL = 2
+# Internal tile types for the generator's logic (shared with the grid engine)
+from gridengine import VOID, FLOOR, WALL
+
+LAYOUT_MODES = ('rooms', 'bsp', 'caves')
+CORRIDOR_SCHEMES = ('chain', 'bsp')
+
+# Defaults used by the interactive prompts and for any key missing from a batch settings file.
+# Chance settings are stored as fractions (0.0 - 1.0), exactly as get_user_settings() returns them.
+DEFAULT_SETTINGS = {
+    "width": 80, "height": 60, "max_rooms": 10, "min_size": 6, "max_size": 12,
+    "num_encounters": 4, "min_monsters": 1, "max_monsters": 4, "num_treasures": 2,
+    "door_probability": 0.80, "wide_corridor_chance": 0.20, "cavern_chance": 0.15,
+    "room_feature_chance": 0.40, "num_traps": 3, "num_secret_doors": 2,
+    "filename": "advanced_dungeon.json",
+    "wall_format": "grid", # 'grid' (what the VTT imports), 'rle' or 'bitset' - see mapformat.py
+    "zip_package": False,  # Write a VTT session .zip with each monster image stored once
+    "write_stats": False,  # Also write <map>.stats.json with per-phase timings and counters
+    "tile_size": 0,        # >0: lay the map out in chunks of about this size across all cores (large maps)
+    "bestiary": "",        # Monster list JSON (see bestiary.py); empty uses the MONSTER_MANUAL below
+    "encounter_xp": 0,     # >0: fill each encounter to this XP budget (bestiary needs 'xp' or 'cr') instead of min/max monsters
+    "layout_mode": "rooms", # 'rooms' (random placement), 'bsp' (space partitioning; always fits max_rooms if there's space) or 'caves'
+    "corridor_scheme": "chain", # 'chain' joins rooms left to right; 'bsp' joins BSP siblings (bsp layout only)
+    "cave_fill": 0.45,     # Caves: starting chance of rock per tile
+    "cave_iterations": 5,  # Caves: smoothing passes
+    "cache_dir": "",       # Folder for cached generation stages (see STAGED PIPELINE); empty disables caching
+    "levels": 1,           # >1: build this many levels linked by stairs (see MULTI-LEVEL DUNGEONS)
+}
+
+# Folder that the monster manual's relative 'images/...' URLs are resolved from
+IMAGE_ROOT = os.path.dirname(os.path.abspath(__file__))
 
 # --- MONSTER MANUAL (can be expanded) ---
 # Initiative is now a bonus to be added to a d20 roll.
@@ -123,6 +183,11 @@ MONSTER_MANUAL = [
     }
 ]
 
+@functools.lru_cache(maxsize=None)
+def get_bestiary(path=''):
+    """The indexed monster list for a settings 'bestiary' path (loaded once per process)."""
+    return load_bestiary(path) if path else Bestiary(MONSTER_MANUAL)
+
 # ==============================================================================
 # --- CORE CLASSES & HELPER FUNCTIONS ---
 # ==============================================================================
@@ -136,27 +201,14 @@ class Rectangle:
     def center(self):
         return ((self.x1 + self.x2) // 2, (self.y1 + self.y2) // 2)
 
-    def intersects(self, other):
+    def intersects(self, other, buffer=2):
         # Returns true if this rectangle intersects with another one (with a buffer)
-        return (self.x1 <= other.x2 + 2 and self.x2 >= other.x1 - 2 and
-                self.y1 <= other.y2 + 2 and self.y2 >= other.y1 - 2)
-
-def roll_hit_dice(dice_string):
-    """Parses a dice string like '2d6' or '10d12+40' and returns the result."""
-    total, bonus = 0, 0
-    if '+' in dice_string:
-        dice_part, bonus_part = dice_string.split('+')
-        bonus = int(bonus_part)
-    else:
-        dice_part = dice_string
-    num_dice, die_type = [int(p) for p in dice_part.split('d')]
-    for _ in range(num_dice):
-        total += random.randint(1, die_type)
-    return total + bonus
+        return (self.x1 <= other.x2 + buffer and self.x2 >= other.x1 - buffer and
+                self.y1 <= other.y2 + buffer and self.y2 >= other.y1 - buffer)
 
 # --- MODIFIED: Added prompts for new features ---
-def get_user_settings():
-    """Gets all the generation parameters from the user."""
+def get_user_settings(max_dimension=1000):
+    """Gets all the generation parameters from the user. Tiled maps (--tile-size) may be larger than 1000."""
     settings = {}
     print("--- Thor-Grid Dungeon Generator (v9 - Advanced Features) ---")
     
@@ -169,111 +221,214 @@ def get_user_settings():
                 if min_val <= val <= max_val: return val
                 else: print(f"Please enter a number between {min_val} and {max_val}.")
             except ValueError: print("Invalid input. Please enter a whole number.")
-            
+
+    def percent(key):
+        return round(DEFAULT_SETTINGS[key] * 100)
+
     print("\n--- Basic Layout ---")
-    settings['width'] = get_int_input("Grid Width", 80, 20)
-    settings['height'] = get_int_input("Grid Height", 60, 20)
-    settings['max_rooms'] = get_int_input("Number of Rooms", 10, 2)
-    settings['min_size'] = get_int_input("Min Room Size", 6, 4)
-    settings['max_size'] = get_int_input("Max Room Size", 12, 4)
+    while True:
+        layout_mode = input(f"Layout ({'/'.join(LAYOUT_MODES)}) [default: {DEFAULT_SETTINGS['layout_mode']}]: ").strip().lower()
+        if not layout_mode or layout_mode in LAYOUT_MODES: break
+        print(f"Please enter one of: {', '.join(LAYOUT_MODES)}.")
+    settings['layout_mode'] = layout_mode or DEFAULT_SETTINGS['layout_mode']
+    settings['width'] = get_int_input("Grid Width", DEFAULT_SETTINGS['width'], 20, max_dimension)
+    settings['height'] = get_int_input("Grid Height", DEFAULT_SETTINGS['height'], 20, max_dimension)
+    settings['max_rooms'] = get_int_input("Number of Rooms", DEFAULT_SETTINGS['max_rooms'], 2, max(1000, max_dimension))
+    settings['min_size'] = get_int_input("Min Room Size", DEFAULT_SETTINGS['min_size'], 4)
+    settings['max_size'] = get_int_input("Max Room Size", DEFAULT_SETTINGS['max_size'], 4)
+    if settings['layout_mode'] == 'bsp':
+        scheme = input("Join BSP siblings instead of chaining rooms left to right? (y/N): ").strip().lower()
+        settings['corridor_scheme'] = 'bsp' if scheme.startswith('y') else 'chain'
+    if settings['layout_mode'] == 'caves':
+        settings['cave_fill'] = get_int_input("Cave Rock Fill %", percent('cave_fill'), 30, 70) / 100.0
+        settings['cave_iterations'] = get_int_input("Cave Smoothing Passes", DEFAULT_SETTINGS['cave_iterations'], 0, 20)
+    settings['levels'] = get_int_input("Number of Levels (linked by stairs)", DEFAULT_SETTINGS['levels'], 1, 100)
     
     print("\n--- Dungeon Content ---")
-    settings['num_encounters'] = get_int_input("Number of Monster Encounter Rooms", 4, 0)
-    settings['min_monsters'] = get_int_input("Min monsters per encounter", 1, 1)
-    settings['max_monsters'] = get_int_input("Max monsters per encounter", 4, 1)
-    settings['num_treasures'] = get_int_input("Number of Treasures", 2, 0)
+    settings['num_encounters'] = get_int_input("Number of Monster Encounter Rooms", DEFAULT_SETTINGS['num_encounters'], 0)
+    settings['min_monsters'] = get_int_input("Min monsters per encounter", DEFAULT_SETTINGS['min_monsters'], 1)
+    settings['max_monsters'] = get_int_input("Max monsters per encounter", DEFAULT_SETTINGS['max_monsters'], 1)
+    settings['num_treasures'] = get_int_input("Number of Treasures", DEFAULT_SETTINGS['num_treasures'], 0)
     
     print("\n--- Advanced Features ---")
-    settings['door_probability'] = get_int_input("Door Chance %", 80, 0, 100) / 100.0
-    settings['wide_corridor_chance'] = get_int_input("Wide Corridor Chance %", 20, 0, 100) / 100.0
-    settings['cavern_chance'] = get_int_input("Jagged Corridor (Cavern) Chance %", 15, 0, 100) / 100.0
-    settings['room_feature_chance'] = get_int_input("Room Feature (Pillars/Pools) Chance %", 40, 0, 100) / 100.0
-    settings['num_traps'] = get_int_input("Number of Traps", 3, 0)
-    settings['num_secret_doors'] = get_int_input("Number of Secret Doors", 2, 0)
+    settings['door_probability'] = get_int_input("Door Chance %", percent('door_probability'), 0, 100) / 100.0
+    settings['wide_corridor_chance'] = get_int_input("Wide Corridor Chance %", percent('wide_corridor_chance'), 0, 100) / 100.0
+    settings['cavern_chance'] = get_int_input("Jagged Corridor (Cavern) Chance %", percent('cavern_chance'), 0, 100) / 100.0
+    settings['room_feature_chance'] = get_int_input("Room Feature (Pillars/Pools) Chance %", percent('room_feature_chance'), 0, 100) / 100.0
+    settings['num_traps'] = get_int_input("Number of Traps", DEFAULT_SETTINGS['num_traps'], 0)
+    settings['num_secret_doors'] = get_int_input("Number of Secret Doors", DEFAULT_SETTINGS['num_secret_doors'], 0)
 
 
     filename_input = input("\nEnter output filename [default: advanced_dungeon.json]: ")
     settings['filename'] = filename_input or 'advanced_dungeon.json'
     if not settings['filename'].endswith('.json'): settings['filename'] += '.json'
+    settings['zip_package'] = input("Save as a .zip package with monster images? (y/N): ").strip().lower().startswith('y')
     return settings
 
 # --- NEW: Helper function to add features to a single room ---
-def add_room_features(room, grid, tokens, settings):
-    """Adds pillars or pools to a given room based on chance."""
-    if random.random() > settings['room_feature_chance']:
+def add_room_features(room, grid, tokens, settings, rng=random, occupancy=None):
+    """Adds pillars or pools to a given room based on chance. A pool is left out if it would cover another token."""
+    if rng.random() > settings['room_feature_chance']:
         return
 
     # Ensure the room is large enough for features
     if room.x2 - room.x1 < 5 or room.y2 - room.y1 < 5:
         return
 
-    feature = random.choice(['pillars', 'pool'])
+    feature = rng.choice(['pillars', 'pool'])
 
     if feature == 'pillars':
         # Add 2-4 pillars, avoiding the very center and edges
-        for _ in range(random.randint(2, 4)):
+        for _ in range(rng.randint(2, 4)):
             # Place pillar within the inner part of the room
-            px = random.randint(room.x1 + 1, room.x2 - 2)
-            py = random.randint(room.y1 + 1, room.y2 - 2)
-            # Make sure not to block the center, which might be used for start/exit points
-            if (px, py) != room.center():
-                grid[py][px] = WALL
+            px = rng.randint(room.x1 + 1, room.x2 - 2)
+            py = rng.randint(room.y1 + 1, room.y2 - 2)
+            # Make sure not to block the center, which might be used for start/exit points, or a stair
+            if (px, py) != room.center() and (occupancy is None or occupancy.fits(px, py)):
+                grid[py, px] = WALL
 
     elif feature == 'pool':
         # Create a pool token in the center of a sub-rectangle of the room
-        pool_w = random.randint(2, room.x2 - room.x1 - 2)
-        pool_h = random.randint(2, room.y2 - room.y1 - 2)
-        pool_x = random.randint(room.x1 + 1, room.x2 - 1 - pool_w)
-        pool_y = random.randint(room.y1 + 1, room.y2 - 1 - pool_h)
-        tokens.append({
-            "name": "Pool", "x": pool_x, "y": pool_y,
-            "size": max(pool_w, pool_h), # VTT token size
-            "backgroundColor": "dodgerblue", "owner": "DM"
-        })
+        pool_w = rng.randint(2, room.x2 - room.x1 - 2)
+        pool_h = rng.randint(2, room.y2 - room.y1 - 2)
+        pool_x = rng.randint(room.x1 + 1, room.x2 - 1 - pool_w)
+        pool_y = rng.randint(room.y1 + 1, room.y2 - 1 - pool_h)
+        if occupancy is None: occupancy = Occupancy.from_tokens(grid.shape[1], grid.shape[0], tokens)
+        if occupancy.fits(pool_x, pool_y, max(pool_w, pool_h)):
+            occupancy.place(tokens, {
+                "name": "Pool", "x": pool_x, "y": pool_y,
+                "size": max(pool_w, pool_h), # VTT token size
+                "backgroundColor": "dodgerblue", "owner": "DM"
+            })
+
+def make_monster(template, x, y, monster_counts, rng=random):
+    """Turns a monster template into a numbered token with rolled HP and initiative."""
+    monster_token = template.copy()
+    base_name = monster_token['name']
+    monster_counts[base_name] = monster_counts.get(base_name, 0) + 1
+    monster_token['name'] = f"{base_name} {monster_counts[base_name]}"
+    rolled_hp = max(1, dice.roll(monster_token['hit_dice'], rng)) # Compiled once per expression, then cached; '1d4-5' can't go below 1 HP
+    monster_token['hp'], monster_token['maxHP'] = rolled_hp, rolled_hp
+    rolled_initiative = rng.randint(1, 20) + monster_token['initiative_bonus']
+    monster_token['initiative'] = rolled_initiative
+    del monster_token['hit_dice'], monster_token['initiative_bonus']
+    monster_token['x'], monster_token['y'] = x, y
+    monster_token['owner'] = 'DM'
+    return monster_token
+
+def free_floor_in(room, grid, occupancy):
+    """Boolean mask of the FLOOR tiles inside a room that no token covers yet."""
+    return (grid[room.y1:room.y2, room.x1:room.x2] == FLOOR) & occupancy.free(room)
+
+def place_encounter(room, grid, tokens, settings, monster_counts, rng=random, occupancy=None):
+    """Places one monster encounter in a room's free floor, numbering monsters through monster_counts.
+    Returns the number of spawn corners tried."""
+    room_w = room.x2 - room.x1
+    room_h = room.y2 - room.y1
+    monsters = get_bestiary(settings.get('bestiary', ''))
+    eligible_monsters = monsters.fitting(room_w, room_h) # Bucket lookup by size
+    if not eligible_monsters:
+        print(f"  - Warning: Skipping room, too small for any available monsters.")
+        return 0
+    if settings.get('encounter_xp'):
+        # The encounter is chosen up front to fit the XP budget; each monster takes the first free spot
+        encounter = monsters.build_encounter(settings['encounter_xp'], room_w, room_h, rng, settings['max_monsters'])
+    else:
+        num_monsters_to_place = rng.randint(settings['min_monsters'], settings['max_monsters'])
+    placed_in_room, corners_tried = 0, 0
+    if occupancy is None: occupancy = Occupancy.from_tokens(grid.shape[1], grid.shape[0], tokens)
+    # Summed-area table over the room's free floor: footprint checks are O(1) for any size
+    room_floor = free_floor_in(room, grid, occupancy)
+    footprints = FootprintIndex(room, room_floor.tolist())
+    origin = (room.x1, room.y1)
+    if settings.get('encounter_xp'):
+        for monster_template in encounter:
+            monster_size = monster_template.get('size', 1)
+            for start_x, start_y in gridengine.random_cells(room_floor, rng, origin):
+                corners_tried += 1
+                if footprints.fits(start_x, start_y, monster_size):
+                    occupancy.place(tokens, make_monster(monster_template, start_x, start_y, monster_counts, rng))
+                    footprints.occupy(start_x, start_y, monster_size)
+                    break
+        return corners_tried
+    for start_x, start_y in gridengine.random_cells(room_floor, rng, origin):
+        if placed_in_room >= num_monsters_to_place: break
+        corners_tried += 1
+        monster_template = rng.choice(eligible_monsters)
+        monster_size = monster_template.get('size', 1)
+        if footprints.fits(start_x, start_y, monster_size):
+            occupancy.place(tokens, make_monster(monster_template, start_x, start_y, monster_counts, rng))
+            footprints.occupy(start_x, start_y, monster_size)
+            placed_in_room += 1
+    return corners_tried
+
+def place_treasure(room, grid, tokens, rng=random, occupancy=None):
+    """Places one treasure on a random free floor tile in the room. Returns False if there was none;
+    the treasure then goes in the center, unless a token is already there."""
+    if occupancy is None: occupancy = Occupancy.from_tokens(grid.shape[1], grid.shape[0], tokens)
+    spot = next(gridengine.random_cells(free_floor_in(room, grid, occupancy), rng, (room.x1, room.y1)), None)
+    x, y = spot if spot is not None else room.center() # Fallback to center
+    if spot is not None or occupancy.fits(x, y):
+        occupancy.place(tokens, {"name": "Treasure", "x": x, "y": y, "backgroundColor": "gold", "size": 1})
+    return spot is not None
+
+def corridor_path(start, end, settings, rng=random):
+    """Returns the tiles of an L-shaped corridor between two points, styled normal, wide or cavern by chance."""
+    prev_cx, prev_cy = start
+    new_cx, new_cy = end
+
+    # Decide corridor style for this connection
+    style_roll = rng.random()
+    corridor_style = 'normal'
+    if style_roll < settings['cavern_chance']:
+        corridor_style = 'cavern'
+    elif style_roll < settings['cavern_chance'] + settings['wide_corridor_chance']:
+        corridor_style = 'wide'
+
+    path = []
+    # Get the L-shaped path coordinates
+    if rng.randint(0, 1) == 1: # Horizontal then vertical
+        h_path = [(x, prev_cy) for x in range(min(prev_cx, new_cx), max(prev_cx, new_cx) + 1)]
+        v_path = [(new_cx, y) for y in range(min(prev_cy, new_cy), max(prev_cy, new_cy) + 1)]
+    else: # Vertical then horizontal
+        v_path = [(prev_cx, y) for y in range(min(prev_cy, new_cy), max(prev_cy, new_cy) + 1)]
+        h_path = [(x, new_cy) for x in range(min(prev_cx, new_cx), max(prev_cx, new_cx) + 1)]
+
+    # Apply style to path
+    if corridor_style == 'wide':
+        for x, y in h_path: path.extend([(x, y), (x, y + 1)])
+        for x, y in v_path: path.extend([(x, y), (x + 1, y)])
+    elif corridor_style == 'cavern':
+        for x, y in h_path: path.append((x, y + rng.randint(-1, 1)))
+        for x, y in v_path: path.append((x + rng.randint(-1, 1), y))
+        path = list(dict.fromkeys(path)) # Remove duplicates
+    else: # normal
+        path.extend(h_path)
+        path.extend(v_path)
+    return path
 
 # --- NEW: Helper function to place traps and secret doors ---
-def place_extras(rooms, all_path_tiles, grid, tokens, settings):
-    """Places traps and secret doors on the map."""
-    # Place Traps
+def place_extras(grid, tokens, settings, rng=random, stats=None, occupancy=None):
+    """Places traps and secret doors on tiles no other token covers."""
+    if occupancy is None: occupancy = Occupancy.from_tokens(grid.shape[1], grid.shape[0], tokens)
+    # Place Traps on free room and corridor floor, drawn straight from the grid
     print("Placing traps...")
-    available_floor = list(all_path_tiles)
-    for room in rooms:
-        for y in range(room.y1, room.y2):
-            for x in range(room.x1, room.x2):
-                available_floor.append((x, y))
-    
-    random.shuffle(available_floor)
-    for _ in range(settings['num_traps']):
-        if not available_floor: break
-        x, y = available_floor.pop()
-        tokens.append({
+    if stats: stats.phase('traps')
+    for x, y in itertools.islice(gridengine.random_cells((grid == FLOOR) & occupancy.free(), rng), settings['num_traps']):
+        occupancy.place(tokens, {
             "name": "Trap", "x": x, "y": y, "size": 1,
             "backgroundColor": "crimson", "owner": "DM"
         })
 
     # Place Secret Doors
     print("Placing secret doors...")
-    potential_secret_door_walls = []
-    for y in range(1, settings['height'] - 1):
-        for x in range(1, settings['width'] - 1):
-            if grid[y][x] == WALL:
-                # Check for a wall separating two floor areas (horizontally or vertically)
-                if (grid[y][x-1] == FLOOR and grid[y][x+1] == FLOOR) or \
-                   (grid[y-1][x] == FLOOR and grid[y+1][x] == FLOOR):
-                    continue # This is a normal door or a 1-tile thick wall, not a good secret door spot
-                
-                # Look for a wall with floor on one side and another wall on the other
-                if (grid[y][x-1] == FLOOR and grid[y][x+1] == WALL) or \
-                   (grid[y][x+1] == FLOOR and grid[y][x-1] == WALL) or \
-                   (grid[y-1][x] == FLOOR and grid[y+1][x] == WALL) or \
-                   (grid[y+1][x] == FLOOR and grid[y-1][x] == WALL):
-                    potential_secret_door_walls.append((x, y))
-
-    random.shuffle(potential_secret_door_walls)
-    for _ in range(settings['num_secret_doors']):
-        if not potential_secret_door_walls: break
-        x, y = potential_secret_door_walls.pop()
-        tokens.append({
+    if stats: stats.phase('secret_doors')
+    # Walls with floor on one side and more wall behind, ignoring the map border
+    candidates = gridengine.wall_adjacent_to_floor(grid, thick_only=True)
+    candidates[[0, -1], :] = False
+    candidates[:, [0, -1]] = False
+    for x, y in itertools.islice(gridengine.random_cells(candidates & occupancy.free(), rng), settings['num_secret_doors']):
+        occupancy.place(tokens, {
             "name": "Secret Door", "x": x, "y": y, "size": 1,
             "backgroundColor": "dimgray", "owner": "DM"
         })
@@ -283,224 +438,774 @@ def place_extras(rooms, all_path_tiles, grid, tokens, settings):
 # --- DUNGEON GENERATION LOGIC ---
 # ==============================================================================
 
-def generate_and_save_dungeon(settings):
-    """Main function to generate and save the dungeon."""
-    
-    grid = [[VOID for _ in range(settings['width'])] for _ in range(settings['height'])]
+def layout_rooms(settings, rng, stats, min_rooms=2):
+    """Places the rooms and walls them in. Returns (grid, rooms), or None if too few rooms fit."""
+    grid = gridengine.new_grid(settings['width'], settings['height'])
     rooms = []
+    room_index = RectIndex(settings['max_size'] + 4) # Overlap checks only look at nearby rooms
     print("\nPlacing room blueprints...")
+    stats.phase('place_rooms')
 
-    # (Room placement logic is unchanged)
     max_attempts = settings['max_rooms'] * 20
     attempts = 0
     while len(rooms) < settings['max_rooms'] and attempts < max_attempts:
-        w = random.randint(settings['min_size'], settings['max_size'])
-        h = random.randint(settings['min_size'], settings['max_size'])
-        x = random.randrange(1, settings['width'] - w - 1)
-        y = random.randrange(1, settings['height'] - h - 1)
+        w = rng.randint(settings['min_size'], settings['max_size'])
+        h = rng.randint(settings['min_size'], settings['max_size'])
+        x = rng.randrange(1, settings['width'] - w - 1)
+        y = rng.randrange(1, settings['height'] - h - 1)
         new_room = Rectangle(x, y, w, h)
-        if not any(new_room.intersects(other) for other in rooms):
+        if not any(new_room.intersects(other) for other in room_index.nearby(new_room, 2)):
             rooms.append(new_room)
+            room_index.add(new_room)
         attempts += 1
+    stats.count('room_attempts', attempts)
+    stats.count('rooms_rejected', attempts - len(rooms))
 
-    if len(rooms) < 2:
+    if len(rooms) < min_rooms:
         print(f"Error: Only placed {len(rooms)} rooms.")
-        return
+        return None
 
     print(f"Successfully placed {len(rooms)} rooms.")
     
+    return build_rooms(grid, rooms, stats), rooms
+
+def build_rooms(grid, rooms, stats):
+    """Fills the rooms with floor and walls them in. Returns the grid."""
     print("Building rooms...")
+    stats.phase('build_rooms')
     for room in rooms:
-        for y in range(room.y1, room.y2):
-            for x in range(room.x1, room.x2):
-                grid[y][x] = FLOOR
-        for y in range(room.y1 - 1, room.y2 + 1):
-            for x in range(room.x1 - 1, room.x2 + 1):
-                if 0 <= y < settings['height'] and 0 <= x < settings['width'] and grid[y][x] == VOID:
-                    grid[y][x] = WALL
+        gridengine.fill_rect(grid, room, FLOOR)
+    gridengine.wall_in(grid, grid == FLOOR)
+    return grid
+
+def bsp_layout(settings, rng, stats, min_rooms=2):
+    """Places max_rooms rooms by binary space partitioning (see bsptree.py), or as many as the map has
+    space for. Returns (grid, rooms, links) with the BSP sibling links, or None if too few rooms fit."""
+    print("\nPartitioning the map into rooms...")
+    stats.phase('place_rooms')
+    rooms, links = bsptree.split_rooms(settings['width'], settings['height'], settings['max_rooms'],
+                                       settings['min_size'], settings['max_size'], Rectangle, rng)
+    stats.count('room_attempts', len(rooms))
+    stats.count('rooms_rejected', 0)
+    if len(rooms) < settings['max_rooms']:
+        print(f"The map only has space for {len(rooms)} rooms of Min Room Size {settings['min_size']}.")
+    if len(rooms) < min_rooms:
+        print(f"Error: Only placed {len(rooms)} rooms.")
+        return None
+    print(f"Successfully placed {len(rooms)} rooms.")
+    grid = gridengine.new_grid(settings['width'], settings['height'])
+    return build_rooms(grid, rooms, stats), rooms, links
 
+def cave_layout(settings, rng, stats, min_rooms=2):
+    """Grows a cavern with cellular automata and picks open min_size squares in it as the 'rooms'
+    that encounters, treasure and Start/Exit go in. Returns (grid, rooms), or None if too few fit."""
+    width, height = settings['width'], settings['height']
+    print("\nGrowing caves...")
+    stats.phase('cave_fill')
+    noise = np.random.default_rng(rng.getrandbits(64))
+    rock = noise.random((height, width)) < settings['cave_fill']
+    rock[[0, -1], :] = True
+    rock[:, [0, -1]] = True
+
+    stats.phase('cave_smooth')
+    rock = gridengine.smooth_caves(rock, settings['cave_iterations'])
+    rock[[0, -1], :] = True # Keep a solid border so the cave never touches the map edge
+    rock[:, [0, -1]] = True
+
+    # Only the largest cave is kept; the rest would be unreachable pockets
+    stats.phase('cave_regions')
+    cave = gridengine.largest_region(~rock)
+    stats.count('cave_tiles_dropped', int((~rock).sum() - cave.sum()))
+
+    # One random open square per max_size block, then as many non-overlapping ones as max_rooms allows
+    print("Finding cave chambers...")
+    stats.phase('cave_chambers')
+    size, block = settings['min_size'], settings['max_size'] + 4
+    ys, xs = np.nonzero(gridengine.open_squares(cave, size))
+    order = noise.permutation(len(xs))
+    blocks = (ys[order] // block) * (width // block + 1) + xs[order] // block
+    _, first = np.unique(blocks, return_index=True)
+    picks = order[first[noise.permutation(len(first))]]
+    rooms = []
+    room_index = RectIndex(block)
+    for x, y in zip(xs[picks].tolist(), ys[picks].tolist()):
+        if len(rooms) >= settings['max_rooms']:
+            break
+        new_room = Rectangle(x, y, size, size)
+        if not any(new_room.intersects(other) for other in room_index.nearby(new_room, 2)):
+            rooms.append(new_room)
+            room_index.add(new_room)
+    stats.count('cave_chambers', len(rooms))
+
+    if len(rooms) < min_rooms:
+        print(f"Error: Only found {len(rooms)} open cave chambers. Try a lower cave fill or Min Room Size.")
+        return None
+    print(f"Found {len(rooms)} cave chambers.")
+
+    grid = gridengine.new_grid(width, height)
+    grid[cave] = FLOOR
+    gridengine.wall_in(grid, cave)
+    return grid, rooms
+
+def place_layout(settings, rng, stats, min_rooms=2):
+    """Lays out the map in the settings' layout_mode. Returns (grid, rooms, links), or None if too few rooms fit.
+    links are the BSP sibling pairs for the 'bsp' corridor scheme (None for the other layouts)."""
+    layout_mode = settings.get('layout_mode', 'rooms')
+    if layout_mode == 'bsp':
+        return bsp_layout(settings, rng, stats, min_rooms)
+    if layout_mode == 'caves':
+        placed = cave_layout(settings, rng, stats, min_rooms)
+    else:
+        placed = layout_rooms(settings, rng, stats, min_rooms)
+    return None if placed is None else placed + (None,)
+
+def connect_layout(grid, rooms, settings, rng, stats, links=None):
+    """Joins the rooms of a layout. Returns (door_locations, all_path_tiles).
+    BSP links are followed when the corridor_scheme is 'bsp'; otherwise rooms are chained left to right.
+    A cave is already one connected area, so it gets no corridors or doors."""
+    if settings.get('layout_mode', 'rooms') == 'caves':
+        return [], []
+    if settings.get('corridor_scheme', 'chain') != 'bsp':
+        links = None
+    return connect_rooms(grid, rooms, settings, rng, stats, links)
+
+def connect_rooms(grid, rooms, settings, rng, stats, links=None):
+    """Carves corridors between the (i, j) room pairs in links, or between rooms in left-to-right order.
+    Returns (door_locations, all_path_tiles)."""
     # --- MODIFIED: Corridor carving logic to allow for different styles ---
     print("Carving corridors and placing doors...")
+    stats.phase('carve_corridors')
     door_locations = set()
     all_path_tiles = set()
-    rooms.sort(key=lambda r: r.center()[0])
+    if links is None:
+        rooms.sort(key=lambda r: r.center()[0])
+        links = [(i, i + 1) for i in range(len(rooms) - 1)]
 
-    for i in range(len(rooms) - 1):
-        prev_cx, prev_cy = rooms[i].center()
-        new_cx, new_cy = rooms[i+1].center()
-        
-        # Decide corridor style for this connection
-        style_roll = random.random()
-        corridor_style = 'normal'
-        if style_roll < settings['cavern_chance']:
-            corridor_style = 'cavern'
-        elif style_roll < settings['cavern_chance'] + settings['wide_corridor_chance']:
-            corridor_style = 'wide'
-            
-        path = []
-        # Get the L-shaped path coordinates
-        if random.randint(0, 1) == 1: # Horizontal then vertical
-            h_path = [(x, prev_cy) for x in range(min(prev_cx, new_cx), max(prev_cx, new_cx) + 1)]
-            v_path = [(new_cx, y) for y in range(min(prev_cy, new_cy), max(prev_cy, new_cy) + 1)]
-        else: # Vertical then horizontal
-            v_path = [(prev_cx, y) for y in range(min(prev_cy, new_cy), max(prev_cy, new_cy) + 1)]
-            h_path = [(x, new_cy) for x in range(min(prev_cx, new_cx), max(prev_cx, new_cx) + 1)]
-        
-        # Apply style to path
-        if corridor_style == 'wide':
-            for x, y in h_path: path.extend([(x, y), (x, y + 1)])
-            for x, y in v_path: path.extend([(x, y), (x + 1, y)])
-        elif corridor_style == 'cavern':
-            for x, y in h_path: path.append((x, y + random.randint(-1, 1)))
-            for x, y in v_path: path.append((x + random.randint(-1, 1), y))
-            path = list(dict.fromkeys(path)) # Remove duplicates
-        else: # normal
-            path.extend(h_path)
-            path.extend(v_path)
-        
+    for i, j in links:
+        path = corridor_path(rooms[i].center(), rooms[j].center(), settings, rng)
         # Carve path and place doors
-        for px, py in path:
-            if 0 <= px < settings['width'] and 0 <= py < settings['height']:
-                if grid[py][px] == WALL and random.random() < settings['door_probability']:
-                    door_locations.add((px, py))
-                grid[py][px] = FLOOR
-                all_path_tiles.add((px, py))
+        doors, carved = gridengine.carve_path(grid, path, settings['door_probability'], rng)
+        door_locations.update(doors)
+        all_path_tiles.update(carved)
+        stats.count('tiles_carved', len(carved))
 
     print("Building corridor walls...")
-    for px, py in all_path_tiles:
-        for dy in range(-1, 2):
-            for dx in range(-1, 2):
-                if dx == 0 and dy == 0: continue
-                nx, ny = px + dx, py + dy
-                if 0 <= nx < settings['width'] and 0 <= ny < settings['height'] and grid[ny][nx] == VOID:
-                    grid[ny][nx] = WALL
-    
-    tokens = [] # Initialize tokens list earlier for feature functions
+    stats.phase('corridor_walls')
+    gridengine.wall_in(grid, gridengine.path_mask(grid.shape, all_path_tiles))
+    return door_locations, all_path_tiles
+
+def connect_stairs(grid, rooms, stairs, settings, rng, stats):
+    """Makes each stair token's tile part of the dungeon: a stair that isn't on floor gets a corridor
+    to the nearest room, and one the Start room can't reach (e.g. past a jagged corridor's gaps) gets
+    one to the nearest room it can. Returns the doors carved on the way."""
+    stats.phase('stairs')
+    plain = dict(settings, cavern_chance=0) # Jagged corridors can leave walled-in gaps
+    door_locations, stair_tiles = [], set()
+
+    def link(spot, room):
+        path = corridor_path(spot, room.center(), plain, rng)
+        doors, carved = gridengine.carve_path(grid, path, settings['door_probability'], rng)
+        door_locations.extend(doors)
+        stair_tiles.update(carved)
+
+    for stair in stairs:
+        spot = (stair['x'], stair['y'])
+        if grid[spot[1], spot[0]] != FLOOR:
+            link(spot, min(rooms, key=lambda r: roomgraph.dist_sq(r.center(), spot)))
+    gridengine.wall_in(grid, gridengine.path_mask(grid.shape, stair_tiles))
+
+    # The Start token goes in the leftmost room (see populate())
+    dist = gridengine.distance_field(grid, min(rooms, key=lambda r: r.center()[0]).center())
+    reachable = [r for r in rooms if dist[r.center()[1], r.center()[0]] >= 0]
+    relinked = set()
+    for stair in stairs:
+        spot = (stair['x'], stair['y'])
+        if dist[spot[1], spot[0]] < 0:
+            link(spot, min(reachable, key=lambda r: roomgraph.dist_sq(r.center(), spot)))
+            relinked.add(spot)
+    if relinked:
+        gridengine.wall_in(grid, gridengine.path_mask(grid.shape, stair_tiles))
+    stats.count('stair_tiles_carved', len(stair_tiles))
+    stats.count('stairs_relinked', len(relinked))
+    return door_locations
+
+def decorate_rooms(grid, rooms, settings, rng, stats, tokens=None):
+    """Adds pillars and pools to rooms, keeping clear of any tokens already placed (stairs).
+    Returns the token list with the new tokens added."""
+    tokens = tokens if tokens is not None else [] # Initialize tokens list earlier for feature functions
+    occupancy = Occupancy.from_tokens(grid.shape[1], grid.shape[0], tokens)
     
     # --- NEW: Call the function to add features to rooms ---
     print("Adding features to rooms...")
+    stats.phase('room_features')
     for room in rooms:
-        add_room_features(room, grid, tokens, settings)
-    
-    # --- Prepare final JSON data ---
-    thor_grid_walls = [[1 if cell == WALL else 0 for cell in row] for row in grid]
-    
+        add_room_features(room, grid, tokens, settings, rng, occupancy)
+    return tokens
+
+def build_layout(settings, rng, stats, min_rooms=2):
+    """Places rooms, carves corridors and adds room features.
+    Returns (grid, rooms, door_locations, all_path_tiles, tokens), or None if too few rooms fit."""
+    placed = place_layout(settings, rng, stats, min_rooms)
+    if placed is None:
+        return None
+    grid, rooms, links = placed
+    door_locations, all_path_tiles = connect_layout(grid, rooms, settings, rng, stats, links)
+    tokens = decorate_rooms(grid, rooms, settings, rng, stats)
+    return grid, rooms, door_locations, all_path_tiles, tokens
+
+def populate(grid, rooms, door_locations, tokens, settings, rng, stats):
+    """Adds Start/Exit, doors, monsters, treasure, traps and secret doors to a finished layout.
+    Every stage reserves its tiles in one occupancy layer, so no two tokens overlap."""
     # (Placement of Start/Exit and monsters is mostly unchanged)
+    stats.phase('start_exit_doors')
+    occupancy = Occupancy.from_tokens(grid.shape[1], grid.shape[0], tokens) # Pools from the decorate stage
     rooms.sort(key=lambda r: r.center()[0])
     start_room, end_room = rooms[0], rooms[-1]
     
-    x, y = start_room.center()
-    tokens.append({"name": "Start", "x": x, "y": y, "backgroundColor": "lime", "size": 1})
-    x, y = end_room.center()
-    tokens.append({"name": "Exit", "x": x, "y": y, "backgroundColor": "yellow", "size": 1})
+    for room, name, color in ((start_room, "Start", "lime"), (end_room, "Exit", "yellow")):
+        x, y = room.center()
+        if not occupancy.fits(x, y): # A pool covers the center; take another free floor tile
+            x, y = next(gridengine.random_cells(free_floor_in(room, grid, occupancy), rng, (room.x1, room.y1)), (x, y))
+        occupancy.place(tokens, {"name": name, "x": x, "y": y, "backgroundColor": color, "size": 1})
 
     for x, y in door_locations:
-        tokens.append({"name": "Door", "x": x, "y": y, "backgroundColor": "saddlebrown", "size": 1})
+        if occupancy.fits(x, y):
+            occupancy.place(tokens, {"name": "Door", "x": x, "y": y, "backgroundColor": "saddlebrown", "size": 1})
         
     available_rooms = [r for r in rooms if r != start_room and r != end_room]
-    random.shuffle(available_rooms)
+    rng.shuffle(available_rooms)
     monster_counts = {}
     
     print("Placing monsters...")
-    # (Monster placement logic is unchanged)
+    stats.phase('monsters')
+    corners_tried = 0
     for _ in range(settings['num_encounters']):
-        if not available_rooms or not MONSTER_MANUAL: break
+        if not available_rooms or not get_bestiary(settings.get('bestiary', '')): break
         room_for_encounter = available_rooms.pop()
-        room_w = room_for_encounter.x2 - room_for_encounter.x1
-        room_h = room_for_encounter.y2 - room_for_encounter.y1
-        eligible_monsters = [m for m in MONSTER_MANUAL if m['size'] <= room_w and m['size'] <= room_h]
-        if not eligible_monsters:
-            print(f"  - Warning: Skipping room, too small for any available monsters.")
-            continue
-        num_monsters_to_place = random.randint(settings['min_monsters'], settings['max_monsters'])
-        potential_start_points = []
-        for ry in range(room_for_encounter.y1, room_for_encounter.y2):
-            for rx in range(room_for_encounter.x1, room_for_encounter.x2):
-                if grid[ry][rx] == FLOOR: # Only place on floor tiles
-                    potential_start_points.append((rx, ry))
-        random.shuffle(potential_start_points)
-        placed_in_room = 0
-        occupied_in_room = set()
-        for start_x, start_y in potential_start_points:
-            if placed_in_room >= num_monsters_to_place: break
-            monster_template = random.choice(eligible_monsters)
-            monster_size = monster_template.get('size', 1)
-            if start_x + monster_size > room_for_encounter.x2 or start_y + monster_size > room_for_encounter.y2: continue
-            is_valid_spot = True
-            required_tiles = set()
-            for y_offset in range(monster_size):
-                for x_offset in range(monster_size):
-                    tile = (start_x + x_offset, start_y + y_offset)
-                    if tile in occupied_in_room or grid[tile[1]][tile[0]] != FLOOR:
-                        is_valid_spot = False
-                        break
-                    required_tiles.add(tile)
-                if not is_valid_spot: break
-            if is_valid_spot:
-                monster_token = monster_template.copy()
-                base_name = monster_token['name']
-                monster_counts[base_name] = monster_counts.get(base_name, 0) + 1
-                monster_token['name'] = f"{base_name} {monster_counts[base_name]}"
-                rolled_hp = roll_hit_dice(monster_token['hit_dice'])
-                monster_token['hp'], monster_token['maxHP'] = rolled_hp, rolled_hp
-                rolled_initiative = random.randint(1, 20) + monster_token['initiative_bonus']
-                monster_token['initiative'] = rolled_initiative
-                del monster_token['hit_dice'], monster_token['initiative_bonus']
-                monster_token['x'], monster_token['y'] = start_x, start_y
-                monster_token['owner'] = 'DM'
-                tokens.append(monster_token)
-                occupied_in_room.update(required_tiles)
-                placed_in_room += 1
+        corners_tried += place_encounter(room_for_encounter, grid, tokens, settings, monster_counts, rng, occupancy)
+    stats.count('spawn_corners_tried', corners_tried)
+    stats.count('monsters_placed', sum(monster_counts.values()))
     
     print("Placing treasure...")
+    stats.phase('treasure')
+    center_fallbacks = 0
     for _ in range(settings['num_treasures']):
         if not available_rooms: break
         room = available_rooms.pop()
-        # Find a valid floor tile that isn't occupied
-        treasure_placed = False
-        for _ in range(10): # Try 10 times to find a spot
-            tx, ty = random.randint(room.x1, room.x2-1), random.randint(room.y1, room.y2-1)
-            if grid[ty][tx] == FLOOR:
-                tokens.append({"name": "Treasure", "x": tx, "y": ty, "backgroundColor": "gold", "size": 1})
-                treasure_placed = True
-                break
-        if not treasure_placed: # Fallback to center
-            x, y = room.center()
-            tokens.append({"name": "Treasure", "x": x, "y": y, "backgroundColor": "gold", "size": 1})
+        if not place_treasure(room, grid, tokens, rng, occupancy):
+            center_fallbacks += 1
+    stats.count('treasure_center_fallbacks', center_fallbacks)
 
     # --- NEW: Call the function to place traps and secret doors ---
-    place_extras(rooms, all_path_tiles, grid, tokens, settings)
+    place_extras(grid, tokens, settings, rng, stats, occupancy)
+
+def generate(settings, seed=None, stats=None, cache=None):
+    """Builds a dungeon from settings and returns the VTT map data, or None if it failed.
+    The same settings and seed always produce the same map, so any map can be rebuilt later.
+    Pass a PhaseStats to collect per-phase timings and counters, and a StageCache to reuse
+    stages whose settings haven't changed since an earlier run with this seed."""
+    if seed is None:
+        seed = random.SystemRandom().randrange(2**32)
+    stats = stats if stats is not None else PhaseStats()
+    output_data = run_stages(settings, seed, stats, cache)
+    stats.stop()
+    return output_data
 
-    output_data = {
+def distance_data(grid, tokens, rooms):
+    """Steps from Start to every open tile (decode with mapformat.decode_distance_field), to the Exit
+    and to each room center, so depth questions are lookups instead of path searches. -1/None = unreachable."""
+    start = next(t for t in tokens if t['name'] == 'Start')
+    exit_token = next(t for t in tokens if t['name'] == 'Exit')
+    dist = gridengine.distance_field(grid, (start['x'], start['y']))
+    exit_distance = int(dist[exit_token['y'], exit_token['x']])
+    return {
+        "distanceField": gridengine.encode_distance_field(dist, (start['x'], start['y'])),
+        "exitDistance": exit_distance if exit_distance >= 0 else None,
+        "roomDepths": [int(dist[r.center()[1], r.center()[0]]) for r in rooms],
+    }
+
+def map_data(grid, tokens, settings, seed, rooms):
+    """Assembles the VTT map file contents."""
+    data = {
       "tokens": tokens, 
-      "walls": thor_grid_walls, 
+      "walls": gridengine.to_wall_rows(grid), 
+      "wallRects": gridengine.wall_rects(grid), # Merged [x, y, w, h] wall rectangles for sight/lighting code
       "isGridVisible": True, 
       "isMapFullyVisible": False, 
       "backgroundImageUrl": "",
       "gridSize": {"width": settings['width'], "height": settings['height']}, 
-      "version": "vtt-advanced-features-1.0"
+      "version": "vtt-advanced-features-1.0",
+      "seed": seed,
+      "rooms": [[r.x1, r.y1, r.x2, r.y2] for r in rooms], # x2/y2 exclusive; lets reroll.py find rooms later
+      "tokenIndex": tile_index(tokens, settings['width'], settings['height']), # "x,y" -> index into tokens
+      **distance_data(grid, tokens, rooms)
     }
+    if settings.get('level'): # One level of a multi-level dungeon: {"number", "levels", "dungeonSeed"}
+        data['level'] = settings['level']
+    return data
+
+# ==============================================================================
+# --- STAGED PIPELINE & STAGE CACHE ---
+# ==============================================================================
+
+# Each stage continues from the previous stage's state and the same RNG. A stage's cache key hashes
+# the seed plus the settings it and every earlier stage read, and the cached entry stores the RNG
+# state too, so a run resumed from cache produces exactly the same map as a full run.
+
+def _stage_layout(state, settings, seed, rng, stats):
+    placed = place_layout(settings, rng, stats)
+    if placed is None:
+        return None
+    grid, rooms, links = placed
+    return {'grid': grid, 'rooms': rooms, 'links': links}
+
+def _stage_connect(state, settings, seed, rng, stats):
+    door_locations, _ = connect_layout(state['grid'], state['rooms'], settings, rng, stats, state['links'])
+    # Kept as a list: populate() adds doors in iteration order, and a set rebuilt by pickle can iterate differently
+    door_locations = list(door_locations)
+    if settings.get('stairs'):
+        door_locations += connect_stairs(state['grid'], state['rooms'], settings['stairs'], settings, rng, stats)
+    return dict(state, door_locations=door_locations)
+
+def _stage_decorate(state, settings, seed, rng, stats):
+    stairs = [dict(stair) for stair in settings.get('stairs', ())] # Placed first, so nothing covers them
+    return dict(state, tokens=decorate_rooms(state['grid'], state['rooms'], settings, rng, stats, stairs))
+
+def _stage_populate(state, settings, seed, rng, stats):
+    tokens = list(state['tokens'])
+    populate(state['grid'], state['rooms'], state['door_locations'], tokens, settings, rng, stats)
+    return dict(state, tokens=tokens)
+
+def _stage_export(state, settings, seed, rng, stats):
+    stats.phase('map_data')
+    return {'output': map_data(state['grid'], state['tokens'], settings, seed, state['rooms'])}
+
+PIPELINE_VERSION = 4 # Bump when any stage's output changes, so stale cache entries are ignored
+STAGES = (
+    ('layout', _stage_layout, ('width', 'height', 'max_rooms', 'min_size', 'max_size',
+                               'layout_mode', 'cave_fill', 'cave_iterations')),
+    ('connect', _stage_connect, ('corridor_scheme', 'door_probability', 'wide_corridor_chance', 'cavern_chance', 'stairs')),
+    ('decorate', _stage_decorate, ('room_feature_chance',)),
+    ('populate', _stage_populate, ('num_encounters', 'min_monsters', 'max_monsters', 'num_treasures',
+                                   'num_traps', 'num_secret_doors', 'bestiary', 'encounter_xp')),
+    ('export', _stage_export, ('level',)),
+)
+
+def stage_keys(settings, seed):
+    """Cache key for each stage: a running hash of the seed and the settings each stage reads."""
+    digest = hashlib.sha256(f"v{PIPELINE_VERSION}:{seed}".encode())
+    keys = []
+    for name, _, setting_names in STAGES:
+        values = [settings.get(key) for key in setting_names]
+        if name == 'populate' and settings.get('bestiary'):
+            values.append(os.path.getmtime(settings['bestiary'])) # An edited bestiary changes the monsters
+        digest.update(json.dumps([name, values]).encode())
+        keys.append(digest.copy().hexdigest()[:32])
+    return keys
+
+class StageCache:
+    """Stage outputs pickled into a folder, one file per stage key."""
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
 
-    desktop_path = os.path.join(os.path.expanduser('~'), 'Desktop')
-    output_dir = os.path.join(desktop_path, 'VTT_Dungeons')
+    def load(self, key):
+        """Returns (state, rng_state) for a key, or None if it isn't cached (or can't be read)."""
+        try:
+            with open(self._path(key), 'rb') as f:
+                state, rng_state = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if 'rooms' in state:
+            state['rooms'] = [Rectangle(x1, y1, x2 - x1, y2 - y1) for x1, y1, x2, y2 in state['rooms']]
+        return state, rng_state
+
+    def save(self, key, state, rng_state):
+        """Stores a stage's state. Writes to a temporary file first so parallel batch workers never see half a file."""
+        if 'rooms' in state: # Plain tuples, so entries load whichever way this script was started
+            state = dict(state, rooms=[(r.x1, r.y1, r.x2, r.y2) for r in state['rooms']])
+        temp_path = f"{self._path(key)}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            pickle.dump((state, rng_state), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self._path(key))
+
+def run_stages(settings, seed, stats, cache=None):
+    """Runs layout -> connect -> decorate -> populate -> export, resuming after the last cached stage.
+    Returns the VTT map data, or None if too few rooms fit."""
+    rng = random.Random(seed)
+    state, first = {}, 0
+    keys = stage_keys(settings, seed) if cache else None
+    if cache:
+        for i in range(len(STAGES) - 1, -1, -1):
+            cached = cache.load(keys[i])
+            if cached is not None:
+                state, rng_state = cached
+                rng.setstate(rng_state)
+                first = i + 1
+                print(f"\nReusing cached stages up to '{STAGES[i][0]}'.")
+                stats.count('stages_cached', first)
+                break
+    for i in range(first, len(STAGES)):
+        state = STAGES[i][1](state, settings, seed, rng, stats)
+        if state is None:
+            return None
+        if cache:
+            cache.save(keys[i], state, rng.getstate())
+    return state['output']
+
+# ==============================================================================
+# --- TILED GENERATION (LARGE MAPS) ---
+# ==============================================================================
+
+def chunk_bounds(length, tile_size):
+    """Splits 0..length into spans of at least tile_size; the last span absorbs the remainder."""
+    count = max(1, length // tile_size)
+    return [(i * length // count, (i + 1) * length // count) for i in range(count)]
+
+def _chunk_worker(job):
+    """Lays out one chunk in its own coordinates inside a pool worker. Progress output is silenced."""
+    chunk_settings, chunk_seed = job
+    stats = PhaseStats()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        layout = build_layout(chunk_settings, random.Random(chunk_seed), stats, min_rooms=1)
+    stats.stop()
+    if layout is None:
+        return None, stats.counters
+    grid, rooms, door_locations, _, tokens = layout
+    rooms = [(r.x1, r.y1, r.x2 - r.x1, r.y2 - r.y1) for r in rooms]
+    # Doors go back as a list: a set rebuilt by pickle can iterate in another order than the worker's,
+    # and populate() places doors in iteration order
+    return (grid, rooms, list(door_locations), tokens), stats.counters
+
+def generate_tiled(settings, seed=None, stats=None, workers=None):
+    """Builds a large map as chunks of about tile_size x tile_size laid out across a process pool,
+    then joins neighbouring chunks with border corridors and populates the whole map.
+    Each chunk is seeded from the map seed and its position, so the result doesn't depend on workers.
+    Returns the VTT map data, or None if it failed."""
+    if seed is None:
+        seed = random.SystemRandom().randrange(2**32)
+    rng = random.Random(seed)
+    stats = stats if stats is not None else PhaseStats()
+    width, height, tile_size = settings['width'], settings['height'], settings['tile_size']
+    if tile_size < settings['max_size'] + 4:
+        print(f"Error: Tile size must be at least Max Room Size + 4 ({settings['max_size'] + 4}).")
+        return None
+
+    spans = [(x1, y1, x2, y2) for y1, y2 in chunk_bounds(height, tile_size) for x1, x2 in chunk_bounds(width, tile_size)]
+    jobs = []
+    for x1, y1, x2, y2 in spans:
+        # Each chunk gets its share of the room budget by area
+        chunk_rooms = max(1, round(settings['max_rooms'] * (x2 - x1) * (y2 - y1) / (width * height)))
+        jobs.append((dict(settings, width=x2 - x1, height=y2 - y1, max_rooms=chunk_rooms), f"{seed}:{x1}:{y1}"))
+
+    print(f"\nLaying out {len(jobs)} chunks...")
+    stats.phase('chunks')
+    grid = gridengine.new_grid(width, height)
+    rooms, door_locations, tokens = [], {}, [] # Doors in an insertion-ordered dict, so the order is the same for any worker count
+    hubs = [] # (chunk center, rooms in the chunk) for every chunk that placed rooms
+    with contextlib.ExitStack() as stack:
+        if workers == 1:
+            results = map(_chunk_worker, jobs)
+        else:
+            results = stack.enter_context(ProcessPoolExecutor(max_workers=workers)).map(_chunk_worker, jobs)
+        # Chunks are stitched in as they finish, so only a few chunk grids are in flight at once
+        for (x1, y1, x2, y2), (layout, counters) in zip(spans, results):
+            for name, amount in counters.items():
+                stats.count(name, amount)
+            if layout is None:
+                continue
+            chunk_grid, chunk_rooms, chunk_doors, chunk_tokens = layout
+            grid[y1:y2, x1:x2] = chunk_grid
+            placed = [Rectangle(x + x1, y + y1, w, h) for x, y, w, h in chunk_rooms]
+            rooms.extend(placed)
+            hubs.append((((x1 + x2) // 2, (y1 + y2) // 2), placed))
+            door_locations.update(dict.fromkeys((x + x1, y + y1) for x, y in chunk_doors))
+            tokens.extend(dict(token, x=token['x'] + x1, y=token['y'] + y1) for token in chunk_tokens)
+
+    if len(rooms) < 2:
+        print(f"Error: Only placed {len(rooms)} rooms.")
+        stats.stop()
+        return None
+    print(f"Successfully placed {len(rooms)} rooms.")
+
+    # A spanning tree over the chunk centers picks which neighbouring chunks to join; each pair is
+    # linked between its two rooms closest to the midpoint of the chunk centers
+    print("Joining chunks with border corridors...")
+    stats.phase('border_corridors')
+    border_tiles = set()
+    tree_edges, _ = roomgraph.spanning_tree([center for center, _ in hubs])
+    for a, b in tree_edges:
+        (ax, ay), a_rooms = hubs[a]
+        (bx, by), b_rooms = hubs[b]
+        midpoint = ((ax + bx) // 2, (ay + by) // 2)
+        start = min(a_rooms, key=lambda r: roomgraph.dist_sq(r.center(), midpoint)).center()
+        end = min(b_rooms, key=lambda r: roomgraph.dist_sq(r.center(), midpoint)).center()
+        path = corridor_path(start, end, settings, rng)
+        doors, carved = gridengine.carve_path(grid, path, settings['door_probability'], rng)
+        door_locations.update(dict.fromkeys(doors))
+        border_tiles.update(carved)
+        stats.count('tiles_carved', len(carved))
+    gridengine.wall_in(grid, gridengine.path_mask(grid.shape, border_tiles))
+
+    populate(grid, rooms, door_locations, tokens, settings, rng, stats)
+    stats.phase('map_data')
+    output_data = map_data(grid, tokens, settings, seed, rooms)
+    stats.stop()
+    return output_data
+
+def same_for_any_workers(settings, seed, workers=None):
+    """Builds a tiled map serially and across a pool of workers. True if both are identical, as
+    they must be: a seed has to rebuild the same file whatever --workers was."""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        serial = generate_tiled(settings, seed, workers=1)
+        pooled = generate_tiled(settings, seed, workers=workers)
+    return json.dumps(serial) == json.dumps(pooled)
+
+def save_dungeon(output_data, full_output_path, wall_format='grid'):
+    """Writes map data to disk with walls in the given encoding. Raises IOError if the file can't be written."""
+    with open(full_output_path, 'w') as f:
+        # Compact encodings are written without indentation; one value per line would undo the savings
+        json.dump(mapformat.encode_map(output_data, wall_format), f, indent=2 if wall_format == 'grid' else None)
+
+def generate_and_save_dungeon(settings, seed=None, output_dir=None, workers=None):
+    """Main function to generate and save the dungeon. Returns the saved path, or None.
+    With settings['write_stats'], phase timings and counters go to <map>.stats.json alongside it.
+    workers sets the process pool size for tiled maps (settings['tile_size']); tiled maps aren't stage-cached."""
+    stats = PhaseStats()
+    if settings.get('tile_size'):
+        output_data = generate_tiled(settings, seed, stats, workers)
+    else:
+        cache = StageCache(settings['cache_dir']) if settings.get('cache_dir') else None
+        output_data = generate(settings, seed, stats, cache)
+    if output_data is None:
+        return None
+    # Token-sized art when thumbnails.py has been run. Done here rather than in a stage, so cached
+    # stages and generate() don't depend on what's in images/thumbs
+    output_data = dict(output_data, tokens=thumbnails.with_thumbnails(output_data['tokens'], IMAGE_ROOT))
+
+    if output_dir is None:
+        desktop_path = os.path.join(os.path.expanduser('~'), 'Desktop')
+        output_dir = os.path.join(desktop_path, 'VTT_Dungeons')
     os.makedirs(output_dir, exist_ok=True)
     full_output_path = os.path.join(output_dir, settings['filename'])
+    if settings.get('zip_package'):
+        full_output_path = os.path.splitext(full_output_path)[0] + '.zip'
     try:
-        with open(full_output_path, 'w') as f:
-            json.dump(output_data, f, indent=2)
-        print(f"\nSuccess! Dungeon saved to 'VTT_Dungeons' on your Desktop:\n{full_output_path}")
+        stats.phase('save')
+        if settings.get('zip_package'):
+            mapformat.write_package(output_data, full_output_path, IMAGE_ROOT)
+        else:
+            save_dungeon(output_data, full_output_path, settings.get('wall_format', 'grid'))
+        stats.stop()
+        print(f"\nSuccess! Dungeon saved to:\n{full_output_path}")
+        if settings.get('write_stats'):
+            print(f"Stats saved to: {write_stats(stats, full_output_path, seed=output_data['seed'])}")
+        print(f"Seed: {output_data['seed']} (use it with --batch to rebuild this exact map)")
     except IOError as e:
         print(f"\nError: Could not write file '{full_output_path}'. Reason: {e}")
+        return None
+    return full_output_path
+
+# ==============================================================================
+# --- MULTI-LEVEL DUNGEONS ---
+# ==============================================================================
+
+# Stair spots are drawn from the dungeon seed before any level is built, so each level knows where its
+# stairs go and the levels never wait on each other. Level n has its Stairs Down at the spot where level
+# n + 1 has its Stairs Up; connect_stairs() joins a spot to the level's rooms wherever it lands.
+
+def stair_spots(settings, count, rng):
+    """count stair spots, one per pair of adjacent levels, each well away from the one before so a
+    level's up and down stairs aren't side by side."""
+    width, height = settings['width'], settings['height']
+    spread = ((width + height) // 4) ** 2
+    spots = []
+    for _ in range(count):
+        for _ in range(100):
+            spot = (rng.randrange(2, width - 2), rng.randrange(2, height - 2))
+            if not spots or roomgraph.dist_sq(spot, spots[-1]) >= spread:
+                break
+        spots.append(spot)
+    return spots
+
+def stair_token(name, spot, to_level, color):
+    x, y = spot
+    return {"name": name, "x": x, "y": y, "backgroundColor": color, "size": 1, "toLevel": to_level}
+
+def level_jobs(settings, seed, levels):
+    """Settings and seed for each level. Every level gets its own seed drawn from the dungeon seed,
+    so any level rebuilds the same on its own and the results don't depend on the worker count."""
+    rng = random.Random(seed)
+    level_seeds = [rng.randrange(2**32) for _ in range(levels)]
+    spots = stair_spots(settings, levels - 1, rng)
+    base, ext = os.path.splitext(settings['filename'])
+    digits = len(str(levels)) # level01..level10, so the files sort in order
+    jobs = []
+    for n in range(1, levels + 1):
+        stairs = []
+        if n > 1:
+            stairs.append(stair_token("Stairs Up", spots[n - 2], n - 1, "lightskyblue"))
+        if n < levels:
+            stairs.append(stair_token("Stairs Down", spots[n - 1], n + 1, "slateblue"))
+        level_settings = dict(settings, filename=f"{base}_level{n:0{digits}d}{ext}", levels=1, stairs=stairs,
+                              level={"number": n, "levels": levels, "dungeonSeed": seed})
+        jobs.append((level_settings, level_seeds[n - 1]))
+    return jobs
+
+def _level_worker(job):
+    """Generates and saves one level inside a pool worker. Progress output is silenced."""
+    level_settings, level_seed, output_dir = job
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return generate_and_save_dungeon(level_settings, level_seed, output_dir)
+
+def generate_levels(settings, seed=None, output_dir=None, workers=None):
+    """Builds settings['levels'] levels linked by stairs, one file each, across a process pool.
+    Returns the saved paths in level order (None for a level that failed), or None if it can't start."""
+    if settings.get('tile_size'):
+        print("Error: Multi-level dungeons can't be tiled; use a smaller map or --levels 1.")
+        return None
+    if seed is None:
+        seed = random.SystemRandom().randrange(2**32)
+    jobs = [(level_settings, level_seed, output_dir) for level_settings, level_seed in
+            level_jobs(settings, seed, settings['levels'])]
+    print(f"\nBuilding {len(jobs)} levels...")
+    with contextlib.ExitStack() as stack:
+        if workers == 1:
+            paths = list(map(_level_worker, jobs))
+        else:
+            pool = stack.enter_context(ProcessPoolExecutor(max_workers=min(len(jobs), workers or os.cpu_count() or 1)))
+            paths = list(pool.map(_level_worker, jobs))
+    for n, path in enumerate(paths, 1):
+        print(f"  - Level {n}: {path or 'generation failed (too few rooms)'}")
+    print(f"Seed: {seed} (use it with --batch and --levels {len(jobs)} to rebuild this exact dungeon)")
+    return paths
+
+# ==============================================================================
+# --- BATCH MODE ---
+# ==============================================================================
+
+def load_settings_file(path):
+    """Reads a JSON settings file. Missing keys fall back to DEFAULT_SETTINGS."""
+    with open(path) as f:
+        settings = dict(DEFAULT_SETTINGS, **json.load(f))
+    if not settings['filename'].endswith('.json'): settings['filename'] += '.json'
+    return settings
+
+def parse_seed_range(text):
+    """Parses '7', '100-199' or '1,5,9-12' into a list of seeds."""
+    seeds = []
+    for part in text.split(','):
+        if '-' in part.strip()[1:]:
+            start, end = part.rsplit('-', 1)
+            seeds.extend(range(int(start), int(end) + 1))
+        else:
+            seeds.append(int(part))
+    return seeds
+
+def _batch_worker(job):
+    """Generates one seed (inside a pool worker, unless the map is tiled or has levels). Progress output is silenced.
+    For a multi-level dungeon the path is its first level's, or None if any level failed."""
+    settings, seed, output_dir, tile_workers = job
+    base, ext = os.path.splitext(settings['filename'])
+    seed_settings = dict(settings, filename=f"{base}_{seed}{ext}")
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        if settings.get('levels', 1) > 1:
+            paths = generate_levels(seed_settings, seed, output_dir, tile_workers)
+            path = paths[0] if paths and all(paths) else None
+        else:
+            path = generate_and_save_dungeon(seed_settings, seed, output_dir, tile_workers)
+    return seed, path
+
+def run_batch(settings, seeds, output_dir, workers=None):
+    """Generates one dungeon per seed across a process pool. Returns {seed: path or None}."""
+    results = {}
+    with contextlib.ExitStack() as stack:
+        if settings.get('tile_size') or settings.get('levels', 1) > 1:
+            # Tiled maps and multi-level dungeons spread their chunks or levels over the pool themselves,
+            # so the seeds run one after another
+            outcomes = (_batch_worker((settings, seed, output_dir, workers)) for seed in seeds)
+        else:
+            pool = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+            jobs = [(settings, seed, output_dir, 1) for seed in seeds]
+            chunksize = max(1, len(jobs) // ((workers or os.cpu_count() or 1) * 4))
+            outcomes = pool.map(_batch_worker, jobs, chunksize=chunksize)
+        for seed, path in outcomes:
+            results[seed] = path
+            if path is None:
+                print(f"  - Seed {seed}: generation failed (too few rooms).")
+    print(f"Generated {sum(1 for p in results.values() if p)} of {len(seeds)} dungeons in '{output_dir}'.")
+    return results
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Thor-Grid Dungeon Generator. Runs interactively when no options are given.")
+    parser.add_argument('--batch', metavar='SETTINGS_JSON', help="Generate non-interactively from a JSON settings file.")
+    parser.add_argument('--seeds', default='0', help="Seed or seed range, e.g. '42', '1-500' or '1,5,9-12' (default: 0).")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores).")
+    parser.add_argument('--output-dir', default=None, help="Output folder (default: VTT_Dungeons on your Desktop).")
+    parser.add_argument('--wall-format', choices=mapformat.WALL_FORMATS, default=None,
+                        help="Wall encoding. Compact files must be expanded with mapformat.py before importing into the VTT.")
+    parser.add_argument('--zip', action='store_true', help="Write .zip session packages with monster images included.")
+    parser.add_argument('--tile-size', type=int, default=None,
+                        help="Lay the map out in chunks of about this size across --workers processes (for maps beyond 1000x1000).")
+    parser.add_argument('--check-workers', action='store_true',
+                        help="With --batch and --tile-size: check each seed builds the same map with 1 and --workers processes, then exit.")
+    parser.add_argument('--bestiary', default=None, help="Monster list JSON to use instead of the built-in MONSTER_MANUAL.")
+    parser.add_argument('--encounter-xp', type=int, default=None, help="Fill each encounter to this XP budget (needs a bestiary with xp or cr).")
+    parser.add_argument('--layout', choices=LAYOUT_MODES, default=None, help="Layout mode (default: the settings file's layout_mode, or rooms).")
+    parser.add_argument('--corridors', choices=CORRIDOR_SCHEMES, default=None, help="Corridor scheme: chain rooms left to right, or join BSP siblings (--layout bsp).")
+    parser.add_argument('--levels', type=int, default=None, help="Build this many levels linked by stairs, one file per level, in parallel.")
+    parser.add_argument('--cache-dir', default=None, help="Cache generation stages here and reuse the ones whose settings haven't changed.")
+    parser.add_argument('--stats', action='store_true', help="Write <map>.stats.json with per-phase timings and counters next to each map.")
+    return parser.parse_args()
 
 # ==============================================================================
 # --- MAIN EXECUTION ---
 # ==============================================================================
 
 if __name__ == "__main__":
+    args = parse_args()
+    if args.batch:
+        batch_dir = args.output_dir or os.path.join(os.path.expanduser('~'), 'Desktop', 'VTT_Dungeons')
+        batch_settings = load_settings_file(args.batch)
+        if args.wall_format: batch_settings['wall_format'] = args.wall_format
+        if args.zip: batch_settings['zip_package'] = True
+        if args.stats: batch_settings['write_stats'] = True
+        if args.tile_size: batch_settings['tile_size'] = args.tile_size
+        if args.bestiary: batch_settings['bestiary'] = os.path.abspath(args.bestiary)
+        if args.encounter_xp: batch_settings['encounter_xp'] = args.encounter_xp
+        if args.layout: batch_settings['layout_mode'] = args.layout
+        if args.corridors: batch_settings['corridor_scheme'] = args.corridors
+        if args.cache_dir: batch_settings['cache_dir'] = os.path.abspath(args.cache_dir)
+        if args.levels: batch_settings['levels'] = args.levels
+        if args.check_workers:
+            if not batch_settings.get('tile_size'):
+                raise SystemExit("--check-workers needs a tiled map (--tile-size).")
+            mismatches = [seed for seed in parse_seed_range(args.seeds)
+                          if not same_for_any_workers(batch_settings, seed, args.workers)]
+            print(f"Worker-count check: {'all seeds match' if not mismatches else f'seeds differ: {mismatches}'}")
+            raise SystemExit(1 if mismatches else 0)
+        run_batch(batch_settings, parse_seed_range(args.seeds), batch_dir, args.workers)
+        raise SystemExit(0)
     try:
-        user_settings = get_user_settings()
+        user_settings = get_user_settings(max_dimension=20000 if args.tile_size else 1000)
         if user_settings:
-            generate_and_save_dungeon(user_settings)
+            if args.wall_format: user_settings['wall_format'] = args.wall_format
+            if args.zip: user_settings['zip_package'] = True
+            if args.stats: user_settings['write_stats'] = True
+            if args.tile_size: user_settings['tile_size'] = args.tile_size
+            if args.bestiary: user_settings['bestiary'] = os.path.abspath(args.bestiary)
+            if args.encounter_xp: user_settings['encounter_xp'] = args.encounter_xp
+            if args.layout: user_settings['layout_mode'] = args.layout
+            if args.corridors: user_settings['corridor_scheme'] = args.corridors
+            if args.cache_dir: user_settings['cache_dir'] = os.path.abspath(args.cache_dir)
+            if args.levels: user_settings['levels'] = args.levels
+            if user_settings.get('levels', 1) > 1:
+                generate_levels(user_settings, output_dir=args.output_dir, workers=args.workers)
+            else:
+                generate_and_save_dungeon(user_settings, output_dir=args.output_dir, workers=args.workers)
     except KeyboardInterrupt:
         print("\n\nGeneration cancelled by user.")
     except Exception as e:
@@ -0,0 +1,52 @@
+# Thor-Grid Footprint Index
+# Summed-area table over a room's free tiles, used to place multi-tile (size x size) tokens.
+# "Does an N x N footprint fit here?" is answered with four table lookups, and the table is
+# patched in place as tokens are placed. Pure Python, so every generator can use it.
+
+class FootprintIndex:
+    """Tracks which tiles inside a room rectangle are still free for tokens."""
+    def __init__(self, room, free_rows):
+        # free_rows[ly][lx] is truthy when tile (room.x1 + lx, room.y1 + ly) can hold a token
+        self.x1, self.y1 = room.x1, room.y1
+        self.height = len(free_rows)
+        self.width = len(free_rows[0]) if free_rows else 0
+        self.free = [[1 if cell else 0 for cell in row] for row in free_rows]
+        # sat[ly][lx] = number of free tiles in rows < ly and columns < lx
+        self.sat = [[0] * (self.width + 1) for _ in range(self.height + 1)]
+        self._rebuild(0, 0)
+
+    def _rebuild(self, lx, ly):
+        """Recomputes the table entries that depend on tiles at or below/right of (lx, ly)."""
+        free, sat = self.free, self.sat
+        for y in range(ly, self.height):
+            row, above, current = free[y], sat[y], sat[y + 1]
+            row_sum = sum(row[:lx])
+            for x in range(lx, self.width):
+                row_sum += row[x]
+                current[x + 1] = above[x + 1] + row_sum
+
+    def _free_count(self, lx, ly, size):
+        sat = self.sat
+        return sat[ly + size][lx + size] - sat[ly][lx + size] - sat[ly + size][lx] + sat[ly][lx]
+
+    def fits(self, x, y, size):
+        """True if the size x size footprint with top-left corner (x, y) is entirely free."""
+        lx, ly = x - self.x1, y - self.y1
+        if lx < 0 or ly < 0 or lx + size > self.width or ly + size > self.height:
+            return False
+        return self._free_count(lx, ly, size) == size * size
+
+    def corners(self, size):
+        """Lists every top-left corner (x, y) where a size x size footprint fits, in row-major order."""
+        full = size * size
+        return [(self.x1 + lx, self.y1 + ly)
+                for ly in range(self.height - size + 1)
+                for lx in range(self.width - size + 1)
+                if self._free_count(lx, ly, size) == full]
+
+    def occupy(self, x, y, size):
+        """Marks a size x size footprint as taken."""
+        lx, ly = max(x - self.x1, 0), max(y - self.y1, 0)
+        for row in self.free[ly:y - self.y1 + size]:
+            row[lx:x - self.x1 + size] = [0] * len(row[lx:x - self.x1 + size])
+        self._rebuild(lx, ly)
@@ -0,0 +1,261 @@
+# Thor-Grid Grid Engine
+# NumPy-backed tile grid shared by the dungeon generators.
+# The map is a (height, width) uint8 array indexed as grid[y, x].
+# Requires NumPy (pip install numpy).
+
+import base64
+import zlib
+from bisect import bisect_right
+
+import numpy as np
+
+# Internal tile types for the generator's logic
+VOID = 0
+FLOOR = 1
+WALL = 2
+
+def new_grid(width, height, fill=VOID):
+    """Returns a height x width grid filled with a single tile type."""
+    return np.full((height, width), fill, dtype=np.uint8)
+
+def fill_rect(grid, room, tile=FLOOR):
+    """Fills a Rectangle (x2/y2 exclusive) with a tile type, clipped to the grid."""
+    height, width = grid.shape
+    grid[max(room.y1, 0):min(room.y2, height), max(room.x1, 0):min(room.x2, width)] = tile
+
+def dilate(mask):
+    """8-neighbour dilation of a boolean mask: True wherever a cell or any neighbour is True."""
+    height, width = mask.shape
+    padded = np.pad(mask, 1)
+    out = np.zeros_like(mask)
+    for dy in range(3):
+        for dx in range(3):
+            out |= padded[dy:dy + height, dx:dx + width]
+    return out
+
+def neighbour_count(mask):
+    """Number of True cells among each cell's 8 neighbours (cells past the edge count as True).
+    A 3x3 box convolution done as nine shifted adds, so the whole grid is counted at once."""
+    height, width = mask.shape
+    padded = np.pad(mask.astype(np.uint8), 1, constant_values=1)
+    out = np.zeros((height, width), dtype=np.uint8)
+    for dy in range(3):
+        for dx in range(3):
+            if dy != 1 or dx != 1:
+                out += padded[dy:dy + height, dx:dx + width]
+    return out
+
+def smooth_caves(rock, iterations, birth=5, survival=4):
+    """Cellular-automata smoothing of a random rock mask: an open cell fills in with birth or more
+    rock neighbours, and rock stays rock with survival or more. Returns the new rock mask."""
+    for _ in range(iterations):
+        count = neighbour_count(rock)
+        rock = (count >= birth) | (rock & (count >= survival))
+    return rock
+
+def label_regions(open_mask):
+    """Labels the 8-connected areas of an open mask in one pass. Returns (labels, count): labels is
+    -1 outside the mask and 0..count-1 inside, numbered in row-major order of each area's first cell.
+
+    Each row's horizontal runs of open cells are the units. Runs in neighbouring rows that touch
+    (diagonals included) are joined by a vectorised union-find: every round hooks each root onto the
+    smallest root it touches, then pointer jumping flattens the trees, until nothing changes."""
+    height, width = open_mask.shape
+    starts = open_mask.copy()
+    starts[:, 1:] &= ~open_mask[:, :-1]
+    run_id = np.cumsum(starts.ravel(), dtype=np.int64).reshape(height, width) - 1
+    run_id[~open_mask] = -1
+    runs = int(starts.sum())
+    if runs == 0:
+        return run_id, 0
+
+    # One edge per touching pair of runs: pairs repeat along the overlap, so keep where the pair changes
+    edges_a, edges_b = [], []
+    for dx in (-1, 0, 1):
+        a = run_id[:-1, max(-dx, 0):width - max(dx, 0)].ravel()
+        b = run_id[1:, max(dx, 0):width - max(-dx, 0)].ravel()
+        keep = (a >= 0) & (b >= 0)
+        keep[1:] &= (a[1:] != a[:-1]) | (b[1:] != b[:-1])
+        edges_a.append(a[keep])
+        edges_b.append(b[keep])
+    a, b = np.concatenate(edges_a), np.concatenate(edges_b)
+
+    parent = np.arange(runs, dtype=np.int64)
+    while a.size:
+        root_a, root_b = parent[a], parent[b]
+        apart = root_a != root_b
+        if not apart.any():
+            break
+        low, high = np.minimum(root_a, root_b)[apart], np.maximum(root_a, root_b)[apart]
+        np.minimum.at(parent, high, low)
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+        a, b = a[apart], b[apart]
+
+    # Roots are each area's first run, so renumbering them in order keeps areas in row-major order
+    roots, labels_of_runs = np.unique(parent, return_inverse=True)
+    labels = np.where(open_mask, labels_of_runs.reshape(-1)[np.maximum(run_id, 0)], -1)
+    return labels, len(roots)
+
+def largest_region(open_mask):
+    """The largest 8-connected area of an open mask, as a boolean mask (the first one in row-major
+    order on a tie). One labelling pass, however many separate pockets the mask has."""
+    labels, count = label_regions(open_mask)
+    if count == 0:
+        return np.zeros_like(open_mask)
+    sizes = np.bincount(labels[open_mask], minlength=count)
+    return labels == int(np.argmax(sizes))
+
+def open_squares(open_mask, size):
+    """Boolean mask of the top-left corners of every size x size square that is entirely open.
+    Uses a summed-area table, so each square is checked in constant time."""
+    height, width = open_mask.shape
+    out = np.zeros((height, width), dtype=bool)
+    if size > height or size > width:
+        return out
+    table = np.zeros((height + 1, width + 1), dtype=np.int32)
+    table[1:, 1:] = np.cumsum(np.cumsum(open_mask, axis=0, dtype=np.int32), axis=1)
+    area = table[size:, size:] - table[:-size, size:] - table[size:, :-size] + table[:-size, :-size]
+    out[:height - size + 1, :width - size + 1] = area == size * size
+    return out
+
+def wall_in(grid, mask):
+    """Turns every VOID cell touching the mask (including diagonally) into WALL."""
+    grid[dilate(mask) & (grid == VOID)] = WALL
+
+def path_mask(shape, tiles):
+    """Boolean mask with True at each (x, y) in tiles."""
+    mask = np.zeros(shape, dtype=bool)
+    if tiles:
+        xs, ys = zip(*tiles)
+        mask[list(ys), list(xs)] = True
+    return mask
+
+def carve_path(grid, path, door_probability, rng):
+    """Carves an ordered list of (x, y) tiles to FLOOR.
+
+    Each WALL tile broken through becomes a door with door_probability, rolled in path
+    order. Returns (doors, carved) where carved is the de-duplicated in-bounds path."""
+    height, width = grid.shape
+    carved = [(x, y) for x, y in dict.fromkeys(path) if 0 <= x < width and 0 <= y < height]
+    if not carved:
+        return [], carved
+    xs, ys = zip(*carved)
+    was_wall = grid[list(ys), list(xs)] == WALL
+    doors = [carved[i] for i in np.flatnonzero(was_wall) if rng.random() < door_probability]
+    grid[list(ys), list(xs)] = FLOOR
+    return doors, carved
+
+def shifted(grid, dx, dy, fill=VOID):
+    """Returns out where out[y, x] == grid[y + dy, x + dx], with fill past the edges."""
+    height, width = grid.shape
+    out = np.full_like(grid, fill)
+    out[max(-dy, 0):height - max(dy, 0), max(-dx, 0):width - max(dx, 0)] = \
+        grid[max(dy, 0):height - max(-dy, 0), max(dx, 0):width - max(-dx, 0)]
+    return out
+
+def wall_adjacent_to_floor(grid, thick_only=False):
+    """Boolean mask of WALL cells with FLOOR directly beside them (4-neighbour).
+
+    With thick_only, a cell only counts when the tile opposite its floor side is also WALL,
+    and 1-tile walls separating two floor areas are dropped (good secret door spots)."""
+    wall = grid == WALL
+    left, right = shifted(grid, -1, 0), shifted(grid, 1, 0)
+    up, down = shifted(grid, 0, -1), shifted(grid, 0, 1)
+    if not thick_only:
+        return wall & ((left == FLOOR) | (right == FLOOR) | (up == FLOOR) | (down == FLOOR))
+    separating = ((left == FLOOR) & (right == FLOOR)) | ((up == FLOOR) & (down == FLOOR))
+    backed = (((left == FLOOR) & (right == WALL)) | ((right == FLOOR) & (left == WALL)) |
+              ((up == FLOOR) & (down == WALL)) | ((down == FLOOR) & (up == WALL)))
+    return wall & backed & ~separating
+
+def random_cells(mask, rng, origin=(0, 0)):
+    """Yields the (x, y) positions of True cells in a random order, each at most once, offset by origin.
+
+    Nothing is listed up front: a random rank among the True cells is drawn and found through per-row
+    counts, and ranks already drawn are redrawn. Stop early (next(), islice) to draw just k cells."""
+    row_counts = np.count_nonzero(mask, axis=1).tolist()
+    row_ends, total = [], 0
+    for count in row_counts:
+        total += count
+        row_ends.append(total)
+    ox, oy = origin
+    drawn = set()
+    while len(drawn) < total:
+        rank = rng.randrange(total)
+        if rank in drawn:
+            continue
+        drawn.add(rank)
+        y = bisect_right(row_ends, rank)
+        x = int(np.flatnonzero(mask[y])[rank - row_ends[y] + row_counts[y]])
+        yield x + ox, y + oy
+
+def to_wall_rows(grid):
+    """Converts the grid into the VTT 'walls' layout: rows of 1 (wall) / 0 (open)."""
+    return (grid == WALL).astype(np.uint8).tolist()
+
+def wall_rects(grid):
+    """Merges WALL cells into [x, y, w, h] rectangles, ordered top to bottom.
+
+    Each row's wall runs are found at once; a run is stacked onto the rectangle above
+    while the next row repeats it exactly, so straight wall bands become one rectangle."""
+    height, width = grid.shape
+    padded = np.zeros((height, width + 2), dtype=np.int8)
+    padded[:, 1:-1] = grid == WALL
+    edges = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    ends = np.nonzero(edges == -1)[1] # Exclusive; pairs up with starts in the same row-major order
+    bounds = np.searchsorted(rows, np.arange(height + 1)).tolist()
+    starts, ends = starts.tolist(), ends.tolist()
+    rects, open_rects = [], {}
+    for y in range(height):
+        still_open = {}
+        for i in range(bounds[y], bounds[y + 1]):
+            run = (starts[i], ends[i])
+            rect = open_rects.get(run)
+            if rect is None:
+                rect = [run[0], y, run[1] - run[0], 0]
+                rects.append(rect)
+            rect[3] += 1
+            still_open[run] = rect
+        open_rects = still_open
+    return rects
+
+def distance_field(grid, start):
+    """Steps from start to every open tile, or -1 where it can't be reached.
+
+    Like the VTT, anything that isn't WALL is open (jagged cavern corridors leave VOID gaps).
+    Moves go to any of the 8 neighbours and each costs 1, like 5-ft squares. The BFS expands a
+    whole frontier per step with array indexing, so each tile is touched a constant number of times."""
+    height, width = grid.shape
+    stride = width + 2
+    # A closed border of padding means neighbour offsets never wrap or leave the array
+    passable = np.zeros((height + 2, stride), dtype=bool)
+    passable[1:-1, 1:-1] = grid != WALL
+    passable = passable.ravel()
+    dist = np.full(passable.shape, -1, dtype=np.int32)
+    x, y = start
+    source = (y + 1) * stride + x + 1
+    if 0 <= x < width and 0 <= y < height and passable[source]:
+        offsets = np.array([-stride - 1, -stride, -stride + 1, -1, 1, stride - 1, stride, stride + 1])
+        frontier, step = np.array([source]), 0
+        dist[source] = 0
+        while frontier.size:
+            step += 1
+            reached = (frontier[:, None] + offsets).ravel()
+            frontier = np.unique(reached[passable[reached] & (dist[reached] < 0)])
+            dist[frontier] = step
+    return dist.reshape(height + 2, stride)[1:-1, 1:-1]
+
+def encode_distance_field(dist, start):
+    """Packs a distance_field() result for the map file: little-endian u16 (u32 on huge maps), zlib, base64."""
+    bits = 16 if dist.max() < 0xFFFF else 32
+    unreachable = (1 << bits) - 1
+    values = np.where(dist < 0, unreachable, dist).astype(f'<u{bits // 8}')
+    return {
+        "from": list(start), "format": f"zlib-u{bits}le", "unreachable": unreachable,
+        "data": base64.b64encode(zlib.compress(values.tobytes())).decode('ascii'),
+    }
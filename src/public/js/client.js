@@ -2548,6 +2548,25 @@ document.addEventListener('DOMContentLoaded', () => {
 			let imageCounter = 0;
 			const processedTokens = [];
 
+			// Images the server stored from an earlier zip import are fetched and put back in the zip, once each
+			const servedImages = new Map();
+			const addServedImage = (url) => {
+				if (!servedImages.has(url)) {
+					servedImages.set(url, fetch(url).then(response => {
+						if (!response.ok) throw new Error(`HTTP ${response.status}`);
+						return response.blob();
+					}).then(blob => {
+						const imageName = url.split('/').pop();
+						imagesFolder.file(imageName, blob);
+						return `images/${imageName}`; // Path within the zip
+					}).catch(error => {
+						console.error(`Error adding image ${url} to zip:`, error);
+						return url; // Keep the server URL
+					}));
+				}
+				return servedImages.get(url);
+			};
+
 			// 1. Process Tokens: Extract images, replace with paths
 			for (const token of tokensData) {
 				let tokenImagePath = null;
@@ -2569,6 +2588,8 @@ document.addEventListener('DOMContentLoaded', () => {
 						// Keep original imageUrl if saving fails, or set to null
 						tokenImagePath = token.imageUrl; // Or null if you prefer to mark it as failed
 					}
+				} else if (token.imageUrl && token.imageUrl.startsWith('images/imported/')) {
+					tokenImagePath = await addServedImage(token.imageUrl);
 				} else if (token.imageUrl) {
 					// It's a URL, keep it as is for now.
 					// Future enhancement: download and embed these too, or warn user.
@@ -2617,6 +2638,8 @@ document.addEventListener('DOMContentLoaded', () => {
 					showNotification('Error saving background image. It might be skipped.', true);
 					// Keep original if saving fails
 				}
+			} else if (backgroundImageUrl && backgroundImageUrl.startsWith('images/imported/')) {
+				processedBackgroundImageUrl = await addServedImage(backgroundImageUrl);
 			}
 
 			// 3. Create the main state JSON
@@ -2674,7 +2697,7 @@ document.addEventListener('DOMContentLoaded', () => {
 						const state = JSON.parse(jsonString);
 						if (!state || !state.tokens) throw new Error('Invalid session_data.json format.');
 
-						// Process all image paths into data URLs BEFORE emitting
+						// Read the zip's images as data URLs BEFORE emitting
 						const imageLoadPromises = [];
 
 						const processImage = async (path) => {
@@ -2692,24 +2715,30 @@ document.addEventListener('DOMContentLoaded', () => {
 							return `data:${mimeType};base64,${base64Data}`;
 						};
 						
-						state.tokens.forEach(token => {
-							if (token.imageUrl && token.imageUrl.startsWith('images/')) {
-								const promise = processImage(token.imageUrl).then(dataUrl => {
-									token.imageUrl = dataUrl;
-								});
-								imageLoadPromises.push(promise);
+						// Packages may share one image file between many tokens, so each file is read once and sent
+						// once in state.images. Tokens keep its zip path, and the server stores the file and
+						// points the tokens at it, so the image bytes aren't repeated per token.
+						const zipImagePaths = new Set(state.tokens.map(token => token.imageUrl));
+						zipImagePaths.add(state.backgroundImageUrl);
+						state.images = {};
+						for (const path of zipImagePaths) {
+							if (path && path.startsWith('images/')) {
+								imageLoadPromises.push(processImage(path).then(dataUrl => {
+									if (dataUrl) state.images[path] = dataUrl;
+								}));
 							}
-						});
-
-						if (state.backgroundImageUrl && state.backgroundImageUrl.startsWith('images/')) {
-							const promise = processImage(state.backgroundImageUrl).then(dataUrl => {
-								state.backgroundImageUrl = dataUrl;
-							});
-							imageLoadPromises.push(promise);
 						}
 
-						// Wait for all images to be converted to data URLs
+						// Wait for all images to be read from the zip
 						await Promise.all(imageLoadPromises);
+						state.tokens.forEach(token => {
+							if (token.imageUrl && token.imageUrl.startsWith('images/') && !state.images[token.imageUrl]) {
+								token.imageUrl = null; // Missing from the zip
+							}
+						});
+						if (state.backgroundImageUrl && state.backgroundImageUrl.startsWith('images/') && !state.images[state.backgroundImageUrl]) {
+							state.backgroundImageUrl = null;
+						}
 						
 						// Now emit the fully processed state to the server
 						socket.emit('importState', state);
@@ -0,0 +1,211 @@
+# Thor-Grid Map Format Tools
+# Compact encodings for the 'walls' layer of generated maps, plus a converter back to the
+# plain layout the VTT imports (rows of 1 = wall / 0 = open), and .zip session packages.
+#
+# Encodings (recorded in the map's "version" field as "<version>+walls-<format>"):
+#   grid   - the plain nested list of 0/1 ints (default, what the VTT reads)
+#   rle    - one list of run lengths per row, alternating open/wall and starting with open
+#   bitset - one base64 string of the whole grid, row-major, 1 bit per cell, MSB first
+#
+# Zip packages match the VTT's "Download State" export: session_data.json plus an images/ folder.
+# Each distinct image is stored once, named by a hash of its bytes, however many tokens use it.
+#
+# Usage:
+#   python mapformat.py expand compact.json [out.json]
+#   python mapformat.py compress map.json out.json --format rle|bitset
+#   python mapformat.py package map.json out.zip [--images DIR]
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import sys
+import zipfile
+import zlib
+from array import array
+
+WALL_FORMATS = ('grid', 'rle', 'bitset')
+_TAG = '+walls-'
+
+def encode_walls(walls, fmt):
+    """Encodes a walls grid (rows of 0/1) in the given format."""
+    if fmt == 'grid':
+        return walls
+    if fmt == 'rle':
+        encoded = []
+        for row in walls:
+            runs, current, length = [], 0, 0
+            for cell in row:
+                cell = 1 if cell else 0
+                if cell == current:
+                    length += 1
+                else:
+                    runs.append(length)
+                    current, length = cell, 1
+            runs.append(length)
+            encoded.append(runs)
+        return encoded
+    if fmt == 'bitset':
+        bits = ''.join('1' if cell else '0' for row in walls for cell in row)
+        bits += '0' * (-len(bits) % 8)
+        packed = int(bits, 2).to_bytes(len(bits) // 8, 'big') if bits else b''
+        return base64.b64encode(packed).decode('ascii')
+    raise ValueError(f"Unknown wall format '{fmt}'. Choose one of: {', '.join(WALL_FORMATS)}")
+
+def decode_walls(encoded, width, height, fmt):
+    """Expands encoded walls back into rows of 0/1 ints."""
+    if fmt == 'grid':
+        return encoded
+    if fmt == 'rle':
+        walls = []
+        for runs in encoded:
+            row = []
+            for i, length in enumerate(runs):
+                row.extend([i % 2] * length)
+            walls.append(row)
+        return walls
+    if fmt == 'bitset':
+        packed = base64.b64decode(encoded)
+        bits = format(int.from_bytes(packed, 'big'), f'0{len(packed) * 8}b') if packed else ''
+        return [[1 if bit == '1' else 0 for bit in bits[y * width:(y + 1) * width]] for y in range(height)]
+    raise ValueError(f"Unknown wall format '{fmt}'. Choose one of: {', '.join(WALL_FORMATS)}")
+
+def wall_format(version):
+    """Reads the wall format out of a map's version string ('grid' if none is recorded)."""
+    version = version or ''
+    return version.split(_TAG, 1)[1] if _TAG in version else 'grid'
+
+def encode_map(map_data, fmt):
+    """Returns a copy of map_data with its walls encoded and the format recorded in 'version'."""
+    if fmt == 'grid':
+        return map_data
+    base_version = (map_data.get('version') or '').split(_TAG, 1)[0]
+    walls = decode_walls(map_data['walls'], map_data['gridSize']['width'], map_data['gridSize']['height'],
+                         wall_format(map_data.get('version')))
+    return dict(map_data, walls=encode_walls(walls, fmt), version=f"{base_version}{_TAG}{fmt}")
+
+def decode_map(map_data):
+    """Returns a copy of map_data in the plain layout the VTT imports."""
+    fmt = wall_format(map_data.get('version'))
+    if fmt == 'grid':
+        return map_data
+    size = map_data['gridSize']
+    walls = decode_walls(map_data['walls'], size['width'], size['height'], fmt)
+    return dict(map_data, walls=walls, version=map_data['version'].split(_TAG, 1)[0])
+
+def decode_distance_field(field, width, height):
+    """Expands a map's "distanceField" into rows of step counts, with -1 for unreachable tiles."""
+    bits = {'zlib-u16le': 16, 'zlib-u32le': 32}.get(field['format'])
+    if bits is None:
+        raise ValueError(f"Unknown distance field format '{field['format']}'")
+    values = array('H' if bits == 16 else 'I', zlib.decompress(base64.b64decode(field['data'])))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    unreachable = field['unreachable']
+    return [[-1 if v == unreachable else v for v in values[y * width:(y + 1) * width]] for y in range(height)]
+
+def load_map(path):
+    """Reads a map file in any wall format and returns it in the plain layout."""
+    with open(path) as f:
+        return decode_map(json.load(f))
+
+# ==============================================================================
+# --- ZIP PACKAGES ---
+# ==============================================================================
+
+IMAGE_EXTENSIONS = {'image/png': 'png', 'image/jpeg': 'jpg', 'image/gif': 'gif', 'image/webp': 'webp'}
+ZIP_DATE = (1980, 1, 1, 0, 0, 0) # Fixed timestamp so the same map always packages to the same bytes
+
+def resolve_image(image_root, url):
+    """Finds a relative image URL like 'images/ogre.png' under image_root (case-insensitive fallback)."""
+    path = os.path.join(image_root, *url.split('/'))
+    if os.path.isfile(path):
+        return path
+    folder, name = os.path.split(path)
+    if os.path.isdir(folder):
+        for entry in sorted(os.listdir(folder)):
+            if entry.lower() == name.lower():
+                return os.path.join(folder, entry)
+    return None
+
+def read_image(url, image_root):
+    """Returns (bytes, extension) for a data: URL or a relative image path, or (None, None) if unavailable."""
+    if url.startswith('data:image'):
+        header, data = url.split(',', 1)
+        mime = header[len('data:'):].split(';', 1)[0]
+        return base64.b64decode(data), IMAGE_EXTENSIONS.get(mime, 'png')
+    if url.startswith(('http://', 'https://')):
+        return None, None
+    path = resolve_image(image_root, url)
+    if path is None:
+        return None, None
+    with open(path, 'rb') as f:
+        return f.read(), os.path.splitext(path)[1].lstrip('.').lower() or 'png'
+
+def content_name(data, extension):
+    """Zip path for an image, keyed by the hash of its bytes."""
+    return f"images/{hashlib.sha256(data).hexdigest()[:16]}.{extension}"
+
+def write_package(map_data, zip_path, image_root):
+    """Writes map_data as a VTT session .zip with every referenced image stored once.
+    Returns the number of distinct images packaged."""
+    map_data = decode_map(map_data) # The VTT reads plain walls from session_data.json
+    packaged = {} # source url -> zip path (None if the image couldn't be read)
+    blobs = {}    # zip path -> bytes
+
+    def package_url(url):
+        if not url:
+            return url
+        if url not in packaged:
+            data, extension = read_image(url, image_root)
+            packaged[url] = content_name(data, extension) if data is not None else None
+            if data is not None:
+                blobs[packaged[url]] = data
+            elif not url.startswith(('http://', 'https://')):
+                print(f"  - Warning: Image '{url}' not found; leaving the URL as is.")
+        return packaged[url] or url
+
+    tokens = [dict(token, imageUrl=package_url(token['imageUrl'])) if token.get('imageUrl') else token
+              for token in map_data.get('tokens', [])]
+    session = dict(map_data, tokens=tokens, backgroundImageUrl=package_url(map_data.get('backgroundImageUrl')))
+
+    with zipfile.ZipFile(zip_path, 'w') as zf:
+        info = zipfile.ZipInfo('session_data.json', ZIP_DATE)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        zf.writestr(info, json.dumps(session, indent=2))
+        for name in sorted(blobs):
+            zf.writestr(zipfile.ZipInfo(name, ZIP_DATE), blobs[name]) # Images are already compressed
+    return len(blobs)
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert Thor-Grid map files between wall encodings.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    expand = sub.add_parser('expand', help="Expand compact walls back to the plain VTT layout.")
+    expand.add_argument('source')
+    expand.add_argument('target', nargs='?', help="Output file (default: overwrite the source).")
+    compress = sub.add_parser('compress', help="Re-encode walls in a compact format.")
+    compress.add_argument('source')
+    compress.add_argument('target')
+    compress.add_argument('--format', choices=WALL_FORMATS[1:], default='rle')
+    package = sub.add_parser('package', help="Bundle a map and its images into a VTT session .zip.")
+    package.add_argument('source')
+    package.add_argument('target')
+    package.add_argument('--images', default=os.path.dirname(os.path.abspath(__file__)),
+                         help="Folder that relative 'images/...' URLs are resolved from (default: this script's folder).")
+    args = parser.parse_args()
+
+    map_data = load_map(args.source)
+    if args.command == 'package':
+        count = write_package(map_data, args.target, args.images)
+        print(f"Wrote '{args.target}' with {count} image(s).")
+        return
+    if args.command == 'compress':
+        map_data = encode_map(map_data, args.format)
+    target = args.target or args.source
+    with open(target, 'w') as f:
+        json.dump(map_data, f, indent=2 if args.command == 'expand' else None)
+    print(f"Wrote '{target}' (walls: {wall_format(map_data.get('version'))}).")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# Thor-Grid Occupancy
+# One layer shared by every placement stage recording which tiles already hold a generated token,
+# so pools, Start/Exit, doors, monsters, treasure, traps and secret doors never stack on a tile.
+# Checking or reserving a size x size footprint is a slice of a bitmap. tile_index() turns a finished
+# token list into the tile -> token lookup written to the map file ("tokenIndex").
+# Requires NumPy (pip install numpy).
+
+import numpy as np
+
+def token_size(token):
+    """Tiles per side covered by a token (VTT tokens are size x size squares from their x, y corner)."""
+    return max(1, int(token.get('size', 1)))
+
+class Occupancy:
+    """A (height, width) bitmap of tiles covered by tokens."""
+    def __init__(self, width, height):
+        self.taken = np.zeros((height, width), dtype=bool)
+
+    @classmethod
+    def from_tokens(cls, width, height, tokens):
+        """An occupancy layer with every token in the list already reserved."""
+        occupancy = cls(width, height)
+        for token in tokens:
+            occupancy.reserve(token['x'], token['y'], token_size(token))
+        return occupancy
+
+    def fits(self, x, y, size=1):
+        """True if the size x size footprint at (x, y) is on the map and entirely free."""
+        height, width = self.taken.shape
+        if x < 0 or y < 0 or x + size > width or y + size > height:
+            return False
+        if size == 1:
+            return not self.taken[y, x]
+        return not self.taken[y:y + size, x:x + size].any()
+
+    def reserve(self, x, y, size=1):
+        """Marks a footprint as taken (clipped to the map)."""
+        self.taken[max(y, 0):max(y + size, 0), max(x, 0):max(x + size, 0)] = True
+
+    def place(self, tokens, token):
+        """Appends a token and reserves its footprint."""
+        tokens.append(token)
+        self.reserve(token['x'], token['y'], token_size(token))
+
+    def free(self, room=None):
+        """Boolean mask of free tiles, for the whole map or just inside a Rectangle."""
+        if room is None:
+            return ~self.taken
+        return ~self.taken[room.y1:room.y2, room.x1:room.x2]
+
+def tile_index(tokens, width, height):
+    """Maps each covered tile "x,y" to the index of the token on it, for every on-map tile a token
+    covers. Where tokens do overlap (e.g. hand-placed ones) the first token in the list wins."""
+    index = {}
+    for i, token in enumerate(tokens):
+        x, y, size = token['x'], token['y'], token_size(token)
+        for ty in range(max(y, 0), min(y + size, height)):
+            for tx in range(max(x, 0), min(x + size, width)):
+                index.setdefault(f"{tx},{ty}", i)
+    return index
@@ -0,0 +1,60 @@
+# Thor-Grid Phase Stats
+# Wall-clock timers for each generation phase plus named counters for the hot loops, so a slow
+# settings profile can be traced to the phase (and the retry loop) that blows up.
+# The generators always collect stats (a few clock reads per phase); writing them out is opt-in.
+# With track_memory, each phase's peak traced memory is recorded too (only while tracemalloc is running).
+
+import json
+import os
+import time
+import tracemalloc
+
+class PhaseStats:
+    """Collects per-phase timings and event counters for one generated map.
+    Phases run back to back: starting one ends the previous, like the generators' progress prints."""
+    def __init__(self, track_memory=False):
+        self.phases = {}   # phase name -> seconds, in the order phases first ran
+        self.counters = {} # counter name -> int
+        self.peaks = {} if track_memory else None # phase name -> peak traced bytes
+        self._current, self._started = None, 0.0
+
+    def phase(self, name):
+        """Ends the running phase (if any) and starts timing the named one. Repeated phases accumulate."""
+        now = time.perf_counter()
+        if self._current is not None:
+            self.phases[self._current] = self.phases.get(self._current, 0.0) + now - self._started
+        if self.peaks is not None and tracemalloc.is_tracing():
+            if self._current is not None:
+                peak = tracemalloc.get_traced_memory()[1]
+                self.peaks[self._current] = max(self.peaks.get(self._current, 0), peak)
+            tracemalloc.reset_peak() # The next phase's peak starts from what's allocated now
+        self._current, self._started = name, now
+
+    def stop(self):
+        """Ends the running phase."""
+        self.phase(None)
+
+    def count(self, name, amount=1):
+        """Adds amount to a counter. Hot loops should tally locally and call this once."""
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def to_dict(self):
+        data = {
+            "total_seconds": round(sum(self.phases.values()), 6),
+            "phases": {name: round(seconds, 6) for name, seconds in self.phases.items()},
+            "counters": dict(self.counters),
+        }
+        if self.peaks:
+            data["peak_bytes"] = dict(self.peaks)
+        return data
+
+def stats_path(map_path):
+    """Path of the stats file written next to a map: dungeon.json -> dungeon.stats.json."""
+    return os.path.splitext(map_path)[0] + '.stats.json'
+
+def write_stats(stats, map_path, **extra):
+    """Writes stats (plus any extra top-level fields, e.g. the seed) next to map_path. Returns the path."""
+    path = stats_path(map_path)
+    with open(path, 'w') as f:
+        json.dump(dict(extra, **stats.to_dict()), f, indent=2)
+    return path
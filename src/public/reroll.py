@@ -0,0 +1,212 @@
+# Thor-Grid Region Re-roll
+# Re-rolls the contents of one room, or of every room touching a rectangle, in a map made by
+# floortowall.py: room features (pillars/pools), monsters, treasure and traps. Corridors, doors,
+# secret doors, Start/Exit, walls outside the chosen rooms and every other token stay exactly as they were.
+#
+# A room keeps its role: a room that held an encounter gets a fresh encounter, one with treasure gets
+# fresh treasure, and its traps move to new floor tiles in the same room. Needs the room list that
+# floortowall.py records in each map ("rooms"); maps from the other generators don't have one.
+#
+# Usage:
+#   python reroll.py map.json --room 34,18 [--seed N] [--only features,monsters] [--output out.json]
+#   python reroll.py map.json --rect 20,10,40,30 [--settings settings.json]
+
+import argparse
+import itertools
+from bisect import bisect_left
+import json
+import random
+
+import numpy as np
+
+import floortowall
+import gridengine
+import mapformat
+import thumbnails
+from floortowall import Rectangle
+from occupancy import Occupancy, token_size
+from gridengine import FLOOR, WALL
+
+PARTS = ('features', 'monsters', 'treasure', 'traps')
+
+def map_rooms(map_data):
+    """The rooms recorded in a map, as Rectangles."""
+    if not map_data.get('rooms'):
+        raise ValueError("This map has no room list. Only maps made by floortowall.py can be re-rolled.")
+    return [Rectangle(x1, y1, x2 - x1, y2 - y1) for x1, y1, x2, y2 in map_data['rooms']]
+
+def rooms_at(rooms, x, y):
+    """Rooms containing the tile (x, y)."""
+    return [room for room in rooms if room.x1 <= x < room.x2 and room.y1 <= y < room.y2]
+
+def rooms_in(rooms, x, y, w, h):
+    """Rooms overlapping the w x h rectangle with top-left corner (x, y)."""
+    return [room for room in rooms if room.x1 < x + w and x < room.x2 and room.y1 < y + h and y < room.y2]
+
+def token_part(token):
+    """Which re-rollable part a token belongs to ('features', 'monsters', ...), or None if it always stays."""
+    name = token.get('name', '')
+    if name == 'Pool': return 'features'
+    if name == 'Trap': return 'traps'
+    if name == 'Treasure': return 'treasure'
+    if 'maxHP' in token: return 'monsters' # Rolled from a bestiary entry
+    return None
+
+def monster_numbers(tokens):
+    """Highest number used per monster name ('Ogre 3' -> {'Ogre': 3}), so new monsters continue the count."""
+    counts = {}
+    for token in tokens:
+        if token_part(token) == 'monsters':
+            base, _, number = token['name'].rpartition(' ')
+            if number.isdigit():
+                counts[base] = max(counts.get(base, 0), int(number))
+    return counts
+
+def update_tile_index(index, old_tokens, removed, kept_taken, new_tokens, width, height):
+    """The tokenIndex for the kept tokens followed by new_tokens, updated from the map's old index.
+    removed is the old list positions of the tokens taken out and kept_taken the tiles the kept tokens
+    cover, so only the removed and new tokens' tiles are looked at, not every token on the map."""
+    removed = sorted(removed)
+    gone = set(removed)
+    updated, freed = {}, []
+    for tile, i in index.items():
+        if i in gone:
+            freed.append(tile)
+        else:
+            updated[tile] = i - bisect_left(removed, i) # Kept tokens move up past the removed ones
+    # A freed tile can still be under a kept token that overlapped the removed one (e.g. hand-placed)
+    covered = [(tile, x, y) for tile in freed for x, y in [map(int, tile.split(','))] if kept_taken[y, x]]
+    if covered:
+        kept = [token for i, token in enumerate(old_tokens) if i not in gone]
+        for tile, x, y in covered:
+            for new_i, token in enumerate(kept):
+                size = token_size(token)
+                if token['x'] <= x < token['x'] + size and token['y'] <= y < token['y'] + size:
+                    updated[tile] = new_i
+                    break
+    offset = len(old_tokens) - len(removed)
+    for i, token in enumerate(new_tokens, offset):
+        x, y, size = token['x'], token['y'], token_size(token)
+        for ty in range(max(y, 0), min(y + size, height)):
+            for tx in range(max(x, 0), min(x + size, width)):
+                updated.setdefault(f"{tx},{ty}", i)
+    return updated
+
+def reroll_rooms(map_data, rooms, settings, seed=None, parts=PARTS):
+    """Re-rolls the given parts inside each room and returns the new map data (plain wall layout).
+    The re-roll is recorded under "rerolls" with its seed, so it can be repeated."""
+    if seed is None:
+        seed = random.SystemRandom().randrange(2**32)
+    rng = random.Random(seed)
+    map_data = mapformat.decode_map(map_data)
+    walls = [list(row) for row in map_data['walls']]
+    # Open tiles count as floor; only tiles inside the chosen rooms are ever looked at
+    grid = np.where(np.array(walls, dtype=np.uint8) == 1, WALL, FLOOR).astype(np.uint8)
+
+    # New tokens start inside a room and are no bigger than it, so only kept tokens within one
+    # room size of the chosen rooms can be in their way
+    reach = max(max(r.x2 - r.x1, r.y2 - r.y1) for r in rooms)
+    left, top = min(r.x1 for r in rooms) - reach, min(r.y1 for r in rooms) - reach
+    right, bottom = max(r.x2 for r in rooms) + reach, max(r.y2 for r in rooms) + reach
+    kept, kept_monsters, nearby, removed, removed_at = [], [], [], [dict.fromkeys(PARTS, 0) for _ in rooms], []
+    for i, token in enumerate(map_data['tokens']):
+        part = token_part(token)
+        owners = rooms_at(rooms, token['x'], token['y']) if part in parts else []
+        if owners:
+            removed[rooms.index(owners[0])][part] += 1
+            removed_at.append(i)
+            continue
+        kept.append(token)
+        if part == 'monsters':
+            kept_monsters.append(token)
+        x, y = token['x'], token['y']
+        if x < right and y < bottom and x + token_size(token) > left and y + token_size(token) > top:
+            nearby.append(token)
+
+    tokens = []
+    monster_counts = monster_numbers(kept_monsters)
+    # New tokens avoid every kept token and each other
+    width, height = map_data['gridSize']['width'], map_data['gridSize']['height']
+    occupancy = Occupancy.from_tokens(width, height, nearby)
+    kept_taken = occupancy.taken.copy() if 'tokenIndex' in map_data else None
+    for room, had in zip(rooms, removed):
+        if 'features' in parts:
+            area = grid[room.y1:room.y2, room.x1:room.x2]
+            area[area == WALL] = FLOOR # Walls inside a room are always pillars
+            floortowall.add_room_features(room, grid, tokens, settings, rng, occupancy)
+        if had['monsters']:
+            floortowall.place_encounter(room, grid, tokens, settings, monster_counts, rng, occupancy)
+        for _ in range(had['treasure']):
+            floortowall.place_treasure(room, grid, tokens, rng, occupancy)
+        free_floor = floortowall.free_floor_in(room, grid, occupancy)
+        for x, y in itertools.islice(gridengine.random_cells(free_floor, rng, (room.x1, room.y1)), had['traps']):
+            occupancy.place(tokens, {"name": "Trap", "x": x, "y": y, "size": 1, "backgroundColor": "crimson", "owner": "DM"})
+        # Only the rows inside the room change
+        for y, row in enumerate(gridengine.to_wall_rows(grid[room.y1:room.y2, room.x1:room.x2]), room.y1):
+            walls[y][room.x1:room.x2] = row
+
+    # New monsters get token-sized art like the rest of a saved map (see floortowall.generate_and_save_dungeon)
+    tokens = thumbnails.with_thumbnails(tokens, floortowall.IMAGE_ROOT)
+    reroll = {"rooms": [[r.x1, r.y1, r.x2, r.y2] for r in rooms], "parts": list(parts), "seed": seed}
+    result = dict(map_data, walls=walls, tokens=kept + tokens, rerolls=map_data.get('rerolls', []) + [reroll])
+    if 'tokenIndex' in map_data:
+        result['tokenIndex'] = update_tile_index(map_data['tokenIndex'], map_data['tokens'], removed_at,
+                                                 kept_taken, tokens, width, height)
+    if 'features' in parts: # Only new pillars change the walls, and with them the distances
+        if 'wallRects' in map_data:
+            result['wallRects'] = gridengine.wall_rects(grid)
+        if 'distanceField' in map_data:
+            result.update(floortowall.distance_data(grid, result['tokens'], map_rooms(map_data)))
+    return result
+
+def parse_ints(text, count):
+    """Parses 'x,y' style arguments; returns None unless there are exactly count whole numbers."""
+    try:
+        values = [int(part) for part in text.split(',')]
+    except ValueError:
+        return None
+    return values if len(values) == count else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-roll the contents of rooms in a floortowall.py map.")
+    parser.add_argument('source', help="Map .json made by floortowall.py (any wall format).")
+    where = parser.add_mutually_exclusive_group(required=True)
+    where.add_argument('--room', metavar='X,Y', help="Re-roll the room containing this tile.")
+    where.add_argument('--rect', metavar='X,Y,W,H', help="Re-roll every room overlapping this rectangle.")
+    parser.add_argument('--only', default=','.join(PARTS), help=f"Parts to re-roll (default: {','.join(PARTS)}).")
+    parser.add_argument('--seed', type=int, default=None, help="Seed for the re-roll (default: random).")
+    parser.add_argument('--settings', help="Settings JSON for chances and monster counts (default: floortowall defaults).")
+    parser.add_argument('--output', help="Output file (default: overwrite the source).")
+    args = parser.parse_args()
+
+    parts = tuple(part for part in args.only.split(',') if part)
+    for part in parts:
+        if part not in PARTS:
+            parser.error(f"Unknown part '{part}'. Choose from: {', '.join(PARTS)}")
+    settings = floortowall.load_settings_file(args.settings) if args.settings else dict(floortowall.DEFAULT_SETTINGS)
+
+    with open(args.source) as f:
+        map_data = json.load(f)
+    try:
+        rooms = map_rooms(map_data)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.room:
+        point = parse_ints(args.room, 2)
+        if point is None: parser.error("--room takes X,Y")
+        chosen = rooms_at(rooms, *point)
+    else:
+        rect = parse_ints(args.rect, 4)
+        if rect is None: parser.error("--rect takes X,Y,W,H")
+        chosen = rooms_in(rooms, *rect)
+    if not chosen:
+        parser.error("No room there.")
+
+    fmt = mapformat.wall_format(map_data.get('version'))
+    result = reroll_rooms(map_data, chosen, settings, args.seed, parts)
+    target = args.output or args.source
+    floortowall.save_dungeon(result, target, fmt)
+    print(f"Re-rolled {len(chosen)} room(s) with seed {result['rerolls'][-1]['seed']}; wrote '{target}'.")
+
+if __name__ == "__main__":
+    main()
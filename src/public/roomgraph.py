@@ -0,0 +1,102 @@
+# Thor-Grid Room Graph
+# Connects room centers with a Minimum Spanning Tree built over a sparse nearest-neighbour graph.
+# A k-d tree finds each room's k nearest rooms, and Prim's algorithm runs on those candidate
+# edges with a heap, so thousands of rooms connect in well under a second.
+
+import heapq
+
+def dist_sq(p1, p2):
+    """Squared distance between two (x, y) points."""
+    return (p1[0] - p2[0])**2 + (p1[1] - p2[1])**2
+
+class KDTree:
+    """A static 2D k-d tree over a list of (x, y) points."""
+    def __init__(self, points):
+        self.points = points
+        self.root = self._build(list(range(len(points))), 0)
+
+    def _build(self, indices, axis):
+        if not indices:
+            return None
+        indices.sort(key=lambda i: self.points[i][axis])
+        mid = len(indices) // 2
+        return (indices[mid], axis,
+                self._build(indices[:mid], 1 - axis),
+                self._build(indices[mid + 1:], 1 - axis))
+
+    def query(self, point, k):
+        """Returns the k nearest points as a sorted list of (dist_sq, index)."""
+        best = [] # max-heap of (-dist_sq, -index)
+        points = self.points
+
+        def visit(node):
+            if node is None:
+                return
+            i, axis, left, right = node
+            d = dist_sq(points[i], point)
+            if len(best) < k:
+                heapq.heappush(best, (-d, -i))
+            elif (-d, -i) > best[0]:
+                heapq.heapreplace(best, (-d, -i))
+            diff = point[axis] - points[i][axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            visit(near)
+            if len(best) < k or diff * diff <= -best[0][0]:
+                visit(far)
+
+        visit(self.root)
+        return sorted((-d, -i) for d, i in best)
+
+def neighbour_edges(points, k):
+    """Candidate edges linking every point to its k nearest neighbours: {(i, j): dist_sq} with i < j."""
+    tree = KDTree(points)
+    edges = {}
+    for i, point in enumerate(points):
+        for d, j in tree.query(point, k + 1):
+            if j != i:
+                edges[(min(i, j), max(i, j))] = d
+    return edges
+
+def spanning_tree(points, k=8):
+    """Builds a Minimum Spanning Tree over the points' nearest-neighbour graph.
+
+    Returns (tree_edges, candidate_edges). tree_edges is a list of (parent, child) index pairs
+    in the order Prim's algorithm adds them, starting from point 0. If the k-nearest graph is
+    not connected, k is doubled until it is (at worst the complete graph)."""
+    n = len(points)
+    if n < 2:
+        return [], {}
+    while True:
+        k = min(k, n - 1)
+        candidate_edges = neighbour_edges(points, k)
+        adjacency = [[] for _ in range(n)]
+        for (i, j), d in candidate_edges.items():
+            adjacency[i].append((d, j))
+            adjacency[j].append((d, i))
+
+        in_tree = [False] * n
+        in_tree[0] = True
+        tree_edges = []
+        heap = [(d, j, 0) for d, j in adjacency[0]]
+        heapq.heapify(heap)
+        while heap and len(tree_edges) < n - 1:
+            d, child, parent = heapq.heappop(heap)
+            if in_tree[child]:
+                continue
+            in_tree[child] = True
+            tree_edges.append((parent, child))
+            for edge in adjacency[child]:
+                if not in_tree[edge[1]]:
+                    heapq.heappush(heap, (edge[0], edge[1], child))
+
+        if len(tree_edges) == n - 1 or k == n - 1:
+            return tree_edges, candidate_edges
+        k *= 2
+
+def extra_edges(candidate_edges, tree_edges, count, rng):
+    """Picks up to count candidate edges that are not in the tree, for corridors that form loops."""
+    if count <= 0:
+        return []
+    in_tree = {(min(a, b), max(a, b)) for a, b in tree_edges}
+    spare = sorted(edge for edge in candidate_edges if edge not in in_tree)
+    return rng.sample(spare, min(count, len(spare)))
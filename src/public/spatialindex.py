@@ -0,0 +1,46 @@
+# Thor-Grid Spatial Index
+# Uniform-bucket index over placed rooms so overlap checks only look at nearby rooms.
+# Works with any object that has x1, y1, x2, y2 (like the generators' Rectangle class).
+
+class RectIndex:
+    """Buckets rectangles into a coarse grid of bucket_size x bucket_size cells."""
+    def __init__(self, bucket_size=16):
+        self.bucket_size = max(1, bucket_size)
+        self.buckets = {}
+        self.items = []
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def _cells(self, x1, y1, x2, y2):
+        # Edges are inclusive, matching Rectangle.intersects()
+        size = self.bucket_size
+        for by in range(y1 // size, y2 // size + 1):
+            for bx in range(x1 // size, x2 // size + 1):
+                yield bx, by
+
+    def add(self, rect):
+        """Adds a rectangle to the index."""
+        self.items.append(rect)
+        for cell in self._cells(rect.x1, rect.y1, rect.x2, rect.y2):
+            self.buckets.setdefault(cell, []).append(rect)
+
+    def remove(self, rect):
+        """Removes a previously added rectangle."""
+        self.items.remove(rect)
+        for cell in self._cells(rect.x1, rect.y1, rect.x2, rect.y2):
+            self.buckets[cell].remove(rect)
+
+    def nearby(self, rect, margin=0):
+        """Yields every indexed rectangle that could touch rect grown by margin on all sides.
+        Callers still run their exact test (e.g. Rectangle.intersects) on the results."""
+        seen = set()
+        buckets = self.buckets
+        for cell in self._cells(rect.x1 - margin, rect.y1 - margin, rect.x2 + margin, rect.y2 + margin):
+            for other in buckets.get(cell, ()):
+                if id(other) not in seen:
+                    seen.add(id(other))
+                    yield other
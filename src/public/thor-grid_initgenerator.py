@@ -7,6 +7,16 @@
 import random
 import json
 import os
+from array import array
+
+import bsptree
+import dice
+import mapformat
+import roomgraph
+import thumbnails
+from bestiary import Bestiary
+from footprint import FootprintIndex
+from spatialindex import RectIndex
 
 # ==============================================================================
 # --- THE MONSTER MANUAL & IMAGE SETUP ---
@@ -38,6 +48,8 @@ MONSTER_MANUAL = [
     }
 ]
 ### --- CHANGE 1 END --- ###
+MONSTERS = Bestiary(MONSTER_MANUAL) # Indexed by size for room eligibility
+IMAGE_ROOT = os.path.dirname(os.path.abspath(__file__)) # Relative 'images/...' URLs are resolved from here
 
 # (The Rectangle class and tunnel functions are unchanged)
 TOKEN_START, TOKEN_EXIT, TOKEN_TREASURE = '>', '<', '$'
@@ -47,59 +59,63 @@ WALL, FLOOR = '#', '.'
 class Rectangle:
     def __init__(self, x, y, w, h): self.x1, self.y1, self.x2, self.y2 = x, y, x + w, y + h
     def center(self): return ((self.x1 + self.x2) // 2, (self.y1 + self.y2) // 2)
-    def intersects(self, other): return (self.x1 <= other.x2 and self.x2 >= other.x1 and self.y1 <= other.y2 and self.y2 >= other.y1)
+    def intersects(self, other, buffer=0): return (self.x1 <= other.x2 + buffer and self.x2 >= other.x1 - buffer and self.y1 <= other.y2 + buffer and self.y2 >= other.y1 - buffer)
     # Helper to get width and height
     def get_wh(self): return (self.x2 - self.x1, self.y2 - self.y1)
 
 # --- Helper Functions ---
-# ... a couple lines before ...
-def create_v_tunnel(grid, y1, y2, x):
-    for y in range(min(y1, y2), max(y1, y2) + 1):
-        if 0 <= y < len(grid) and 0 <= x < len(grid[0]): grid[y][x] = FLOOR
-
-### --- THIS IS THE NEW HELPER FUNCTION --- ###
-def roll_hit_dice(dice_string):
-    """Parses a dice string like '2d6' or '10d12+40' and returns the result."""
-    total = 0
-    bonus = 0
-    
-    if '+' in dice_string:
-        dice_part, bonus_part = dice_string.split('+')
-        bonus = int(bonus_part)
-    else:
-        dice_part = dice_string
-
-    num_dice, die_type = [int(p) for p in dice_part.split('d')]
-    
-    for _ in range(num_dice):
-        total += random.randint(1, die_type)
-        
-    return total + bonus
-### --- END OF NEW HELPER FUNCTION --- ###
-
 def create_room_solid(grid, room):
     for y in range(room.y1, room.y2):
         for x in range(room.x1, room.x2):
             if 0 <= y < len(grid) and 0 <= x < len(grid[0]): grid[y][x] = FLOOR
-def create_h_tunnel(grid, x1, x2, y):
-    for x in range(min(x1, x2), max(x1, x2) + 1):
-        if 0 <= y < len(grid) and 0 <= x < len(grid[0]): grid[y][x] = FLOOR
-def create_v_tunnel(grid, y1, y2, x):
-    for y in range(min(y1, y2), max(y1, y2) + 1):
-        if 0 <= y < len(grid) and 0 <= x < len(grid[0]): grid[y][x] = FLOOR
+def create_h_tunnel(grid, x1, x2, y, room_labels=None, doors=None):
+    for x in range(min(x1, x2), max(x1, x2) + 1): carve_tunnel_tile(grid, x, y, room_labels, doors)
+def create_v_tunnel(grid, y1, y2, x, room_labels=None, doors=None):
+    for y in range(min(y1, y2), max(y1, y2) + 1): carve_tunnel_tile(grid, x, y, room_labels, doors)
+
+# --- Door detection while carving ---
+def label_rooms(rooms, width, height):
+    """Returns a room-id label array: labels[y][x] is the room's index + 1, or 0 outside any room."""
+    labels = [array('I', bytes(4 * width)) for _ in range(height)]
+    for room_id, room in enumerate(rooms, 1):
+        for y in range(max(room.y1, 0), min(room.y2, height)):
+            labels[y][max(room.x1, 0):min(room.x2, width)] = array('I', [room_id]) * (min(room.x2, width) - max(room.x1, 0))
+    return labels
+
+def is_door(grid, room_labels, x, y):
+    """A door is a carved corridor tile (floor outside every room) that touches both a room tile and
+    another corridor tile, i.e. a wall the tunnel broke through next to a room."""
+    height, width = len(grid), len(grid[0])
+    if not (0 <= y < height and 0 <= x < width) or grid[y][x] != FLOOR or room_labels[y][x]: return False
+    touching_room = touching_corridor = False
+    for nx, ny in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+        if 0 <= ny < height and 0 <= nx < width:
+            if room_labels[ny][nx]: touching_room = True
+            elif grid[ny][nx] == FLOOR: touching_corridor = True
+    return touching_room and touching_corridor
+
+def carve_tunnel_tile(grid, x, y, room_labels=None, doors=None):
+    """Carves one tunnel tile. With room_labels and doors given, the door set is updated as the tile opens.
+    Carving only ever adds floor, so re-checking the new tile and its 4 neighbours keeps the set exact."""
+    if not (0 <= y < len(grid) and 0 <= x < len(grid[0])) or grid[y][x] == FLOOR: return
+    grid[y][x] = FLOOR
+    if doors is None: return
+    for cx, cy in ((x, y), (x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+        if (cx, cy) not in doors and is_door(grid, room_labels, cx, cy):
+            doors.add((cx, cy))
 
 # --- UPDATED get_user_settings FUNCTION ---
 def get_user_settings():
     settings = {}; print("--- Thor-Grid Final Encounter Generator (v7 - Dynamic Encounters) ---")
     print("This version supports multiple monsters per room and rolled initiative.\n")
-    def get_int_input(prompt, default):
+    def get_int_input(prompt, default, min_val=1):
         while True:
             user_input = input(f"{prompt} [default: {default}]: ")
             if user_input == '': return default
             try:
                 val = int(user_input);
-                if val > 0: return val # Most inputs should be positive
-                else: print("Please enter a positive number.")
+                if val >= min_val: return val # Most inputs should be positive
+                else: print(f"Please enter a number of at least {min_val}.")
             except ValueError: print("Invalid input. Please enter a whole number.")
     settings['width'] = get_int_input("Grid Width", 80)
     settings['height'] = get_int_input("Grid Height", 50)
@@ -107,6 +123,9 @@ def get_user_settings():
     settings['max_rooms'] = get_int_input("Max Rooms to Generate", 12)
     settings['min_size'] = get_int_input("Min Room Size", 6)
     settings['max_size'] = get_int_input("Max Room Size", 12)
+    bsp = input("Use BSP layout (always places the room count if it fits)? (y/N): ").strip().lower().startswith('y')
+    settings['layout'] = 'bsp' if bsp else 'random'
+    settings['extra_loops'] = get_int_input("Extra Loop Corridors", 0, 0)
     settings['num_encounters'] = get_int_input("Number of Monster Encounter Rooms", 4)
     
     ### --- CHANGE 2 START: User settings for monster counts --- ###
@@ -121,6 +140,13 @@ def get_user_settings():
     filename_input = input("Enter output filename [default: final_dungeon.json]: ")
     settings['filename'] = filename_input or 'final_dungeon.json'
     if not settings['filename'].endswith('.json'): settings['filename'] += '.json'
+    settings['zip_package'] = input("Save as a .zip package with monster images? (y/N): ").strip().lower().startswith('y')
+    if not settings['zip_package']:
+        while True: # Compact encodings must be expanded with mapformat.py before importing into the VTT
+            wall_format = input(f"Wall format ({'/'.join(mapformat.WALL_FORMATS)}) [default: grid]: ").strip().lower()
+            if not wall_format or wall_format in mapformat.WALL_FORMATS: break
+            print(f"Please enter one of: {', '.join(mapformat.WALL_FORMATS)}.")
+        settings['wall_format'] = wall_format or 'grid'
     return settings
 
 # --- UPDATED generate_and_save_dungeon FUNCTION ---
@@ -131,105 +157,55 @@ def generate_and_save_dungeon(settings):
         settings['max_rooms'] = settings['min_rooms']
     grid = [[WALL for _ in range(settings['width'])] for _ in range(settings['height'])]
     rooms = []
+    room_index = RectIndex(settings['max_size'] + 2) # Overlap checks only look at nearby rooms
     target_room_count = random.randint(settings['min_rooms'], settings['max_rooms'])
     print(f"\nAttempting to generate {target_room_count} rooms...")
-    placement_attempts, max_attempts = 0, target_room_count * 20
-    while len(rooms) < target_room_count and placement_attempts < max_attempts:
-        placement_attempts += 1
-        w, h = random.randint(settings['min_size'], settings['max_size']), random.randint(settings['min_size'], settings['max_size'])
-        x, y = random.randrange(1, settings['width'] - w - 1), random.randrange(1, settings['height'] - h - 1)
-        new_room = Rectangle(x, y, w, h)
-        if not any(new_room.intersects(Rectangle(r.x1-1, r.y1-1, r.x2-r.x1+2, r.y2-r.y1+2)) for r in rooms):
-            rooms.append(new_room)
+    if settings.get('layout') == 'bsp':
+        # Space partitioning places every room first time (see bsptree.py)
+        rooms, _ = bsptree.split_rooms(settings['width'], settings['height'], target_room_count,
+                                       settings['min_size'], settings['max_size'], Rectangle, random)
+    else:
+        placement_attempts, max_attempts = 0, target_room_count * 20
+        while len(rooms) < target_room_count and placement_attempts < max_attempts:
+            placement_attempts += 1
+            w, h = random.randint(settings['min_size'], settings['max_size']), random.randint(settings['min_size'], settings['max_size'])
+            x, y = random.randrange(1, settings['width'] - w - 1), random.randrange(1, settings['height'] - h - 1)
+            new_room = Rectangle(x, y, w, h)
+            # Rooms keep a one-tile wall between them
+            if not any(new_room.intersects(r, 1) for r in room_index.nearby(new_room, 1)):
+                rooms.append(new_room)
+                room_index.add(new_room)
     if len(rooms) < settings['min_rooms']:
         print(f"\n--- WARNING ---\nCould not place the minimum required number of rooms ({settings['min_rooms']}).\nOnly placed {len(rooms)} rooms. Try using a larger grid or smaller room sizes.\n-----------------")
         return
     print(f"Successfully placed {len(rooms)} rooms.")
     
-    # Create a "snapshot" of the grid when it's all walls, BEFORE any carving.
-    grid_before_carving = [row[:] for row in grid]
-
-    # Now, carve the rooms into the main grid.
+    # Now, carve the rooms into the main grid and label every room tile with its room id.
     for room in rooms:
         create_room_solid(grid, room)
+    room_labels = label_rooms(rooms, settings['width'], settings['height'])
+
+    # Doors that connect rooms to corridors are found while the tunnels are carved.
+    door_locations = set()
 
     # Build a network of tunnels using a Minimum Spanning Tree.
-    # Helper to calculate squared distance between room centers
-    def dist_sq(p1, p2):
-        return (p1[0] - p2[0])**2 + (p1[1] - p2[1])**2
-
-    connected = {rooms[0]}
-    unconnected = set(rooms[1:])
-    while unconnected:
-        best_dist = float('inf')
-        closest_pair = (None, None)
-        for prev_room in connected:
-            for new_room in unconnected:
-                d = dist_sq(prev_room.center(), new_room.center())
-                if d < best_dist:
-                    best_dist = d
-                    closest_pair = (prev_room, new_room)
-        
-        prev_room, new_room = closest_pair
-        prev_cx, prev_cy = prev_room.center()
-        new_cx, new_cy = new_room.center()
+    # The tree runs over each room's nearest neighbours (see roomgraph.py), so thousands of rooms stay fast.
+    centers = [room.center() for room in rooms]
+    tree_edges, candidate_edges = roomgraph.spanning_tree(centers)
+    # Optional extra corridors reuse the same neighbour graph to form loops.
+    loop_edges = roomgraph.extra_edges(candidate_edges, tree_edges, settings.get('extra_loops', 0), random)
+
+    for prev_index, new_index in tree_edges + loop_edges:
+        prev_cx, prev_cy = centers[prev_index]
+        new_cx, new_cy = centers[new_index]
         
         if random.randint(0, 1) == 1:
-            create_h_tunnel(grid, prev_cx, new_cx, prev_cy)
-            create_v_tunnel(grid, prev_cy, new_cy, new_cx)
+            create_h_tunnel(grid, prev_cx, new_cx, prev_cy, room_labels, door_locations)
+            create_v_tunnel(grid, prev_cy, new_cy, new_cx, room_labels, door_locations)
         else:
-            create_v_tunnel(grid, prev_cy, new_cy, prev_cx)
-            create_h_tunnel(grid, prev_cx, new_cx, new_cy)
-
-        unconnected.remove(new_room)
-        connected.add(new_room)
-
-    # --- Find "Destroyed Wall" Doors that connect rooms to corridors ---
-    # 1. Create a master set of all tiles that belong to any room.
-    all_room_tiles = set()
-    for room in rooms:
-        for y_tile in range(room.y1, room.y2):
-            for x_tile in range(room.x1, room.x2):
-                all_room_tiles.add((x_tile, y_tile))
+            create_v_tunnel(grid, prev_cy, new_cy, prev_cx, room_labels, door_locations)
+            create_h_tunnel(grid, prev_cx, new_cx, new_cy, room_labels, door_locations)
 
-    # 2. Find doors by checking destroyed walls for neighbors.
-    door_locations = set()
-    for y in range(settings['height']):
-        for x in range(settings['width']):
-            # Condition 1 & 2: Was it a wall, but is now a floor?
-            if grid_before_carving[y][x] == WALL and grid[y][x] == FLOOR:
-                
-                is_touching_room = False
-                is_touching_corridor = False
-                
-                # Check all four neighbors of this "destroyed wall" tile.
-                for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                    nx, ny = x + dx, y + dy
-                    if 0 <= ny < settings['height'] and 0 <= nx < settings['width']:
-                        
-                        # Is the neighbor a tile that belongs to any room?
-                        if (nx, ny) in all_room_tiles:
-                            is_touching_room = True
-                        
-                        ### --- THIS IS THE CRITICAL FIX --- ###
-                        # Is the neighbor a floor tile that does NOT belong to any room?
-                        elif grid[ny][nx] == FLOOR and (nx, ny) not in all_room_tiles:
-                            is_touching_corridor = True
-
-                # A true door MUST touch BOTH a room and a corridor.
-                if is_touching_room and is_touching_corridor:
-                    door_locations.add((x, y))
-
-                    # I want a single door token unless there is multiple floor all_room_tiles
-                    # Count how many adjacent floor tiles in all_room_tiles (i.e., how many room tiles touch this door)
-                    adjacent_room_tiles = 0
-                    for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                        nx, ny = x + dx, y + dy
-                        if (nx, ny) in all_room_tiles:
-                            adjacent_room_tiles += 1
-                    # Only add a door token if there is exactly one adjacent room tile (i.e., not a double door)
-                    if adjacent_room_tiles > 1:
-                        continue  # Skip adding a door token for double/multi doors
     # Finally, sort rooms by x-coordinate to determine Start and Exit
     rooms.sort(key=lambda r: r.x1)
     start_room, end_room = rooms[0], rooms[-1]
@@ -257,7 +233,7 @@ def generate_and_save_dungeon(settings):
         room_for_encounter = available_rooms.pop()
         room_w, room_h = room_for_encounter.get_wh()
 
-        eligible_monsters = [m for m in MONSTER_MANUAL if m['size'] <= room_w and m['size'] <= room_h]
+        eligible_monsters = MONSTERS.fitting(room_w, room_h)
         if not eligible_monsters:
             print(f"  - Warning: Skipping a room at ({room_for_encounter.x1}, {room_for_encounter.y1}) because it's too small for any available monsters.")
             continue
@@ -265,14 +241,12 @@ def generate_and_save_dungeon(settings):
         num_monsters_to_place = random.randint(settings['min_monsters'], settings['max_monsters'])
         print(f"  - Attempting to place {num_monsters_to_place} monster(s) in a room of size {room_w}x{room_h}.")
 
-        # Get all valid floor tiles for this room. We use a set for efficient removal.
-        available_spawn_tiles = set()
-        for y in range(room_for_encounter.y1, room_for_encounter.y2):
-            for x in range(room_for_encounter.x1, room_for_encounter.x2):
-                available_spawn_tiles.add((x, y))
-        
+        # Summed-area table over the room's free tiles: any N x N footprint check is O(1)
+        footprints = FootprintIndex(room_for_encounter, [[1] * room_w for _ in range(room_h)])
+
         # This list will hold potential top-left corners for monsters
-        potential_start_points = list(available_spawn_tiles)
+        potential_start_points = [(x, y) for y in range(room_for_encounter.y1, room_for_encounter.y2)
+                                  for x in range(room_for_encounter.x1, room_for_encounter.x2)]
         random.shuffle(potential_start_points)
 
         placed_count = 0
@@ -282,31 +256,19 @@ def generate_and_save_dungeon(settings):
             
             # Try to find a valid spot for this monster
             spot_found = False
-            for i, (start_x, start_y) in enumerate(potential_start_points):
-                required_tiles = []
-                is_valid_spot = True
-                
-                # Check if the entire monster footprint fits within the available tiles
-                for y_offset in range(monster_size):
-                    for x_offset in range(monster_size):
-                        tile = (start_x + x_offset, start_y + y_offset)
-                        if tile not in available_spawn_tiles:
-                            is_valid_spot = False
-                            break
-                        required_tiles.append(tile)
-                    if not is_valid_spot:
-                        break
-                
+            for start_x, start_y in potential_start_points:
                 # If we found a valid spot, place the monster and reserve its tiles
-                if is_valid_spot:
+                if footprints.fits(start_x, start_y, monster_size):
                     monster_token = monster_template.copy()
+                    # Token-sized art when thumbnails.py has been run; the full-size image otherwise
+                    monster_token['imageUrl'] = thumbnails.thumbnail_url(monster_token.get('imageUrl'), monster_size, IMAGE_ROOT)
                     
                     base_name = monster_token['name']
                     monster_counts[base_name] = monster_counts.get(base_name, 0) + 1
                     monster_token['name'] = f"{base_name} {monster_counts[base_name]}"
 
                     # --- ROLL HP AND INITIATIVE ---
-                    rolled_hp = roll_hit_dice(monster_token['hit_dice'])
+                    rolled_hp = max(1, dice.roll(monster_token['hit_dice'])) # A penalty like 1d4-5 still leaves 1 HP
                     monster_token['hp'] = rolled_hp
                     monster_token['maxHP'] = rolled_hp
                     del monster_token['hit_dice'] # Clean up the template key
@@ -324,10 +286,7 @@ def generate_and_save_dungeon(settings):
                     tokens.append(monster_token)
                     
                     # Remove the occupied tiles from future consideration
-                    available_spawn_tiles.difference_update(required_tiles)
-                    
-                    # Also remove them from the list of potential starting points to speed up future checks
-                    potential_start_points = [p for p in potential_start_points if p not in required_tiles]
+                    footprints.occupy(start_x, start_y, monster_size)
                     
                     spot_found = True
                     placed_count += 1
@@ -361,8 +320,14 @@ def generate_and_save_dungeon(settings):
     os.makedirs(output_dir, exist_ok=True)
     full_output_path = os.path.join(output_dir, settings['filename'])
     try:
-        with open(full_output_path, 'w') as f:
-            json.dump(output_data, f, indent=2)
+        if settings.get('zip_package'):
+            # Session .zip with each monster image stored once (images resolve from this script's folder)
+            full_output_path = os.path.splitext(full_output_path)[0] + '.zip'
+            mapformat.write_package(output_data, full_output_path, IMAGE_ROOT)
+        else:
+            wall_format = settings.get('wall_format', 'grid') # see mapformat.py for the compact encodings
+            with open(full_output_path, 'w') as f:
+                json.dump(mapformat.encode_map(output_data, wall_format), f, indent=2 if wall_format == 'grid' else None)
         print(f"\nSuccess! Final encounter map saved to your Desktop in the 'VTT_Dungeons' folder:\n{full_output_path}")
     except IOError as e:
         print(f"\nError: Could not write file '{full_output_path}'. Reason: {e}")
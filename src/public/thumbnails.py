@@ -0,0 +1,152 @@
+# Thor-Grid Token Thumbnails
+# Build step that shrinks the full-size art in images/ to token-sized mip levels (longest side 256, 128,
+# 64 and 32 px) in images/thumbs/, named by a hash of the source bytes. A manifest records each source's
+# hash, so re-running only rebuilds images whose contents changed, and thumbnails no source uses any
+# more are removed.
+#
+# The generators call thumbnail_url() (floortowall through with_thumbnails() when it saves a map): it
+# picks the smallest level that still covers the token on screen (size x 25 px cells, at 2x for zoom and
+# high-DPI screens). Without a manifest - thumbnails never built - they keep the full-size URL, so a saved
+# map's image URLs depend on whether this build step has been run.
+# Building needs Pillow (pip install pillow); reading the manifest doesn't.
+#
+# Usage:
+#   python thumbnails.py [--images DIR] [--force]
+
+import argparse
+import functools
+import hashlib
+import json
+import os
+
+try:
+    from PIL import Image
+except ImportError: # Optional; only needed to build thumbnails
+    Image = None
+
+MIP_LEVELS = (256, 128, 64, 32)  # Longest side in pixels, largest first
+CELL_PIXELS = 25                 # The VTT's pixels per grid cell at 100% zoom
+DISPLAY_SCALE = 2                # Head room for zooming in and high-DPI screens
+SOURCE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
+THUMBS_FOLDER = 'thumbs'
+MANIFEST_NAME = 'manifest.json'
+
+def file_hash(path):
+    """sha256 of a file's bytes, read in 1 MB blocks."""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def manifest_path(image_root):
+    return os.path.join(image_root, 'images', THUMBS_FOLDER, MANIFEST_NAME)
+
+def read_manifest(image_root):
+    """The thumbnail manifest under image_root, or an empty one if thumbnails haven't been built."""
+    try:
+        with open(manifest_path(image_root)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"levels": list(MIP_LEVELS), "images": {}}
+
+@functools.lru_cache(maxsize=None)
+def _cached_manifest(image_root):
+    return read_manifest(image_root)
+
+def thumbnail_url(url, size, image_root):
+    """The URL of the smallest thumbnail of url that covers a size x size tile token, or url itself
+    when there's no thumbnail for it (not built, a data: URL, or art from elsewhere)."""
+    entry = _cached_manifest(image_root)["images"].get((url or '').lower())
+    if not entry:
+        return url
+    wanted = max(1, size) * CELL_PIXELS * DISPLAY_SCALE
+    levels = sorted(int(level) for level in entry["thumbs"])
+    level = next((level for level in levels if level >= wanted), levels[-1])
+    return entry["thumbs"][str(level)]
+
+def with_thumbnails(tokens, image_root):
+    """The token list with each imageUrl swapped for its thumbnail_url(). Tokens with art are copied."""
+    return [dict(token, imageUrl=thumbnail_url(token['imageUrl'], token.get('size', 1), image_root))
+            if token.get('imageUrl') else token for token in tokens]
+
+def _save(image, path, has_alpha):
+    """Writes one level: PNG when it has transparency, JPEG otherwise. Written to a temporary file first."""
+    temp_path = f"{path}.tmp"
+    if has_alpha:
+        image.save(temp_path, 'PNG', optimize=True)
+    else:
+        image.convert('RGB').save(temp_path, 'JPEG', quality=85, optimize=True, progressive=True)
+    os.replace(temp_path, path)
+
+def build_levels(source, digest, thumbs_dir):
+    """Writes every mip level of one source image. Returns ({level: file name}, (width, height))."""
+    with Image.open(source) as image:
+        image.load()
+        original_size = image.size
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+        names = {}
+        for level in MIP_LEVELS: # Each level is shrunk from the one before, so big sources are decoded once
+            image.thumbnail((level, level), Image.LANCZOS)
+            names[level] = f"{digest[:16]}-{level}.{'png' if has_alpha else 'jpg'}"
+            _save(image, os.path.join(thumbs_dir, names[level]), has_alpha)
+    return names, original_size
+
+def build_thumbnails(image_root, force=False):
+    """Brings images/thumbs under image_root up to date with images/. Returns (built, reused, removed)."""
+    if Image is None:
+        raise RuntimeError("Building thumbnails needs Pillow: pip install pillow")
+    images_dir = os.path.join(image_root, 'images')
+    thumbs_dir = os.path.join(images_dir, THUMBS_FOLDER)
+    os.makedirs(thumbs_dir, exist_ok=True)
+    old = read_manifest(image_root)
+    same_levels = old.get("levels") == list(MIP_LEVELS)
+    entries, built, reused = {}, 0, 0
+    for name in sorted(os.listdir(images_dir)):
+        source = os.path.join(images_dir, name)
+        if not name.lower().endswith(SOURCE_EXTENSIONS) or not os.path.isfile(source):
+            continue
+        key = f"images/{name}".lower() # Lookups ignore case, like mapformat.resolve_image()
+        digest = file_hash(source)
+        entry = old["images"].get(key)
+        files_present = entry and all(os.path.isfile(os.path.join(image_root, *url.split('/')))
+                                      for url in entry["thumbs"].values())
+        if not force and same_levels and entry and entry["sha256"] == digest and files_present:
+            entries[key] = entry
+            reused += 1
+            continue
+        print(f"  - {name}")
+        names, (width, height) = build_levels(source, digest, thumbs_dir)
+        entries[key] = {
+            "sha256": digest, "width": width, "height": height,
+            "thumbs": {str(level): f"images/{THUMBS_FOLDER}/{file}" for level, file in names.items()},
+        }
+        built += 1
+
+    # Thumbnails no source points at any more (edited or deleted art)
+    in_use = {url.rsplit('/', 1)[-1] for entry in entries.values() for url in entry["thumbs"].values()}
+    removed = 0
+    for name in os.listdir(thumbs_dir):
+        if name != MANIFEST_NAME and name not in in_use:
+            os.remove(os.path.join(thumbs_dir, name))
+            removed += 1
+
+    with open(manifest_path(image_root), 'w') as f:
+        json.dump({"levels": list(MIP_LEVELS), "images": entries}, f, indent=2, sort_keys=True)
+    _cached_manifest.cache_clear()
+    return built, reused, removed
+
+def main():
+    parser = argparse.ArgumentParser(description="Build token-sized thumbnails for the images folder.")
+    parser.add_argument('--images', default=os.path.dirname(os.path.abspath(__file__)),
+                        help="Folder containing images/ (default: this script's folder).")
+    parser.add_argument('--force', action='store_true', help="Rebuild every thumbnail, even unchanged ones.")
+    args = parser.parse_args()
+    if Image is None:
+        parser.error("Building thumbnails needs Pillow: pip install pillow")
+    built, reused, removed = build_thumbnails(args.images, args.force)
+    print(f"Thumbnails: {built} built, {reused} unchanged, {removed} stale file(s) removed.")
+
+if __name__ == "__main__":
+    main()
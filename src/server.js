@@ -4,6 +4,7 @@ const http = require('http');
 const socketIo = require('socket.io');
 const fs = require('fs').promises;
 const path = require('path');
+const crypto = require('crypto');
 const { debounce } = require('lodash');
 const config = require('./config');
 const { DiceRoll } = require('@dice-roller/rpg-dice-roller');
@@ -86,6 +87,34 @@ app.get('/', (req, res) => {
 const userDataPath = process.env.USER_DATA_PATH || path.join(__dirname, '..', 'data');
 const stateFileName = 'gameState.json';
 const stateFilePath = path.join(userDataPath, stateFileName);
+
+// Images from imported session zips. Each file is stored once, named by a hash of its bytes, and tokens
+// refer to it by URL, so the state that is saved and broadcast carries no image data.
+const importedImagesPath = path.join(userDataPath, 'images', 'imported');
+app.use('/images/imported', express.static(importedImagesPath));
+const IMPORTED_IMAGE_EXTENSIONS = { 'image/png': 'png', 'image/jpeg': 'jpg', 'image/gif': 'gif', 'image/webp': 'webp' };
+
+// Writes each { zipPath: dataUrl } image to importedImagesPath. Returns a Map of zipPath -> served URL.
+async function storeImportedImages(images) {
+    const urls = new Map();
+    if (!images || typeof images !== 'object') return urls;
+    await fs.mkdir(importedImagesPath, { recursive: true });
+    for (const [zipPath, dataUrl] of Object.entries(images)) {
+        const match = typeof dataUrl === 'string' ? /^data:(image\/[a-z+]+);base64,/.exec(dataUrl) : null;
+        const extension = match && IMPORTED_IMAGE_EXTENSIONS[match[1]];
+        if (!extension) continue;
+        const bytes = Buffer.from(dataUrl.slice(match[0].length), 'base64');
+        const name = `${crypto.createHash('sha256').update(bytes).digest('hex').slice(0, 16)}.${extension}`;
+        const filePath = path.join(importedImagesPath, name);
+        try {
+            await fs.access(filePath); // Same picture imported before
+        } catch {
+            await fs.writeFile(filePath, bytes);
+        }
+        urls.set(zipPath, `images/imported/${name}`);
+    }
+    return urls;
+}
 //console.log(`State file path configured: ${stateFilePath}`);
 
 async function ensureStateDirExists() {
@@ -605,8 +634,11 @@ io.on('connection', (socket) => {
 
 				// Apply the imported state to the server's gameState - assign raw parts first
 				// Ensure default values/types for top-level state properties
+				// Zip imports send each image once in newState.images; tokens name it by its path in the zip
+				const importedImages = await storeImportedImages(newState.images);
+
 				gameState.gridSize = newState.gridSize || { width: 40, height: 30 }; // Ensure gridSize is set early for wall normalization
-				gameState.backgroundImageUrl = newState.backgroundImageUrl || '';
+				gameState.backgroundImageUrl = importedImages.get(newState.backgroundImageUrl) || newState.backgroundImageUrl || '';
 				gameState.isGridVisible = newState.isGridVisible !== undefined ? Boolean(newState.isGridVisible) : true;
 				gameState.isMapFullyVisible = newState.isMapFullyVisible !== undefined ? Boolean(newState.isMapFullyVisible) : false;
 				gameState.viewState = newState.viewState || { scale: 1, panX: 0, panY: 0 }; // Ensure viewState
@@ -618,13 +650,9 @@ io.on('connection', (socket) => {
 				// --- ADDED: Normalize and ensure imported tokens have all properties on the SERVER ---
 				// This prevents crashes if the imported JSON is missing expected token properties
 				gameState.tokens = (newState.tokens || []).map(token => {
-					let finalImageUrl = token.imageUrl || null;
-
-					// If the imageUrl is a relative path from a zip (e.g., "images/orc.png"),
-					// we need to convert it to a full data URL *if* the data was loaded from the zip.
-					// However, the client-side code now handles loading from the ZIP and converting to data:url
-					// before emitting. The server just needs to trust what it receives.
+					// A relative path from a zip (e.g., "images/orc.png") becomes the URL of the stored file.
 					// The main job here is to ensure all other properties are valid.
+					let finalImageUrl = importedImages.get(token.imageUrl) || token.imageUrl || null;
 
 					return {
 						...token, // Keep existing properties